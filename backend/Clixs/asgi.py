@@ -2,16 +2,19 @@ import os
 import django
 
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Clixs.settings")
 django.setup()
 from api.middleware import JwtAuthMiddleware
 import api.routing
+from api.writebehind import lifespan
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": JwtAuthMiddleware(
         URLRouter(api.routing.websocket_urlpatterns)
     ),
+    "channel": ChannelNameRouter(api.routing.channel_routes),
+    "lifespan": lifespan,
 })
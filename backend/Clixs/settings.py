@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     # Third-party
     "rest_framework",
@@ -100,6 +101,75 @@ CHANNEL_LAYERS = {
 }
 
 
+# --------------------------------------------------
+# CACHE
+# --------------------------------------------------
+# Redis (same server as the channel layer) by default. Set CACHE_REDIS_URL
+# to an empty value to fall back to per-process local memory.
+CACHE_REDIS_URL = config("CACHE_REDIS_URL", default="redis://127.0.0.1:6379/1")
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Seconds a cached item list/detail response may live
+ITEM_CACHE_TIMEOUT = config("ITEM_CACHE_TIMEOUT", default=300, cast=int)
+
+
+# --------------------------------------------------
+# IMAGE PROCESSING
+# --------------------------------------------------
+# Variants are built by `python manage.py runworker image-processing`.
+# Set IMAGE_PROCESSING_INLINE=True to build them in the request instead.
+IMAGE_PROCESSING_CHANNEL = "image-processing"
+IMAGE_PROCESSING_INLINE = config("IMAGE_PROCESSING_INLINE", default=False, cast=bool)
+
+
+# --------------------------------------------------
+# CHAT
+# --------------------------------------------------
+# Seconds read receipts are held so a burst becomes one UPDATE + broadcast
+READ_RECEIPT_WINDOW = config("READ_RECEIPT_WINDOW", default=1.0, cast=float)
+
+# Most messages replayed to a reconnecting socket before it must reload
+CHAT_REPLAY_LIMIT = config("CHAT_REPLAY_LIMIT", default=200, cast=int)
+
+# Token-bucket limits as "<burst>/<period>" (period: s, min, hour, day);
+# an empty value disables one. Shared across workers through Redis at
+# CACHE_REDIS_URL, per process without it. Subscribes count as connects.
+CHAT_RATE_LIMITS = {
+    "connect.user": config("CHAT_RATE_CONNECT_USER", default="30/min"),
+    "connect.chat": config("CHAT_RATE_CONNECT_CHAT", default="60/min"),
+    "message.user": config("CHAT_RATE_MESSAGE_USER", default="60/min"),
+    "message.chat": config("CHAT_RATE_MESSAGE_CHAT", default="120/min"),
+}
+
+# Presence keys expire this many seconds after the last heartbeat
+PRESENCE_TTL = config("PRESENCE_TTL", default=60, cast=int)
+# At most one "typing" broadcast per connection per this many seconds
+TYPING_THROTTLE = config("TYPING_THROTTLE", default=3.0, cast=float)
+
+# How WebSocket messages are persisted (see api/writebehind.py):
+#   sync  - INSERT per message before it is broadcast (most durable)
+#   group - batched INSERTs, broadcast once the batch commits
+#   async - broadcast at once, batched INSERT shortly after (lowest latency)
+CHAT_MESSAGE_DURABILITY = config("CHAT_MESSAGE_DURABILITY", default="sync")
+CHAT_WRITE_BATCH_SIZE = config("CHAT_WRITE_BATCH_SIZE", default=100, cast=int)
+CHAT_WRITE_QUEUE_SIZE = config("CHAT_WRITE_QUEUE_SIZE", default=1000, cast=int)
+# Seconds an async-mode batch waits for more messages before it is written
+CHAT_WRITE_FLUSH_INTERVAL = config("CHAT_WRITE_FLUSH_INTERVAL", default=0.05, cast=float)
+
+
 # --------------------------------------------------
 # DATABASE
 # --------------------------------------------------
@@ -114,6 +184,36 @@ DATABASES = {
     }
 }
 
+# How connections are reused (see README "Database connections"):
+#   off        - a new connection per request/handshake (old behaviour)
+#   pool       - Django's psycopg pool; the choice for Daphne/ASGI, whose
+#                per-request threads can't keep persistent connections.
+#                Needs psycopg 3: pip install "psycopg[binary,pool]"
+#   persistent - CONN_MAX_AGE reuse per thread (WSGI, runworker)
+#   pgbouncer  - persistent connections to a transaction-mode pgbouncer
+DB_POOL_MODE = config("DB_POOL_MODE", default="off")
+
+if DB_POOL_MODE == "pool":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+            # Per process; see the sizing notes in the README
+            "max_size": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+            # Seconds a request waits for a free connection before failing
+            "timeout": config("DB_POOL_TIMEOUT", default=10, cast=float),
+        },
+    }
+elif DB_POOL_MODE in ("persistent", "pgbouncer"):
+    DATABASES["default"]["CONN_MAX_AGE"] = config("DB_CONN_MAX_AGE", default=60, cast=int)
+    if DB_POOL_MODE == "pgbouncer":
+        # Named cursors don't survive transaction pooling
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+if DB_POOL_MODE != "off":
+    # Reused connections are checked before use (the pool tests each one
+    # as it is handed out), so a dropped connection never fails a request
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
 
 # --------------------------------------------------
 # AUTH
@@ -150,7 +250,7 @@ MEDIA_ROOT = BASE_DIR / "media"
 # --------------------------------------------------
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -165,8 +265,22 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_OBTAIN_SERIALIZER": "api.serializers.ClaimsTokenObtainPairSerializer",
 }
 
+# Seconds an authenticated user row is reused across requests/handshakes
+# (0 disables). Saving or deleting a user drops it in this process at
+# once; other processes pick up the change when their copy expires.
+JWT_USER_CACHE_TIMEOUT = config("JWT_USER_CACHE_TIMEOUT", default=30, cast=int)
+JWT_USER_CACHE_SIZE = config("JWT_USER_CACHE_SIZE", default=1024, cast=int)
+# Also keep entries in the default cache (Redis), shared by all processes
+JWT_USER_CACHE_SHARED = config("JWT_USER_CACHE_SHARED", default=False, cast=bool)
+
+# Hot read views (chat list/messages) take request.user straight from the
+# token claims, with no user lookup. The trade-off: a deactivated user
+# keeps read access there until the access token expires.
+JWT_CLAIMS_USER = config("JWT_CLAIMS_USER", default=False, cast=bool)
+
 
 # --------------------------------------------------
 # CUSTOM USER
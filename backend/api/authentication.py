@@ -0,0 +1,258 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import _acache_call, _cache_call
+
+
+# =========================
+# Authenticated User Cache
+# =========================
+# Every REST request and WebSocket handshake used to re-read the user
+# row. Rows are kept for JWT_USER_CACHE_TIMEOUT seconds in a per-process
+# LRU and, with JWT_USER_CACHE_SHARED, in the default cache as well.
+# Saving or deleting a user drops its entry (see signals.py); other
+# processes catch up once their copy expires.
+#
+# The shared cache holds only what the auth checks read, and the digest
+# of the password hash that tokens carry, never the hash itself. Users
+# rebuilt from it load any other field from the database on access.
+USER_KEY = "auth:user-fields:{pk}"
+SHARED_FIELDS = ("id", "is_active", "is_staff", "is_superuser")
+
+
+class UserCache:
+    """Thread-safe LRU of user rows, each entry expiring after the timeout."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user, timeout=None):
+        if timeout is None:
+            timeout = settings.JWT_USER_CACHE_TIMEOUT
+        expires = time.monotonic() + timeout
+        with self.lock:
+            self.entries[user_id] = (user, expires)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.JWT_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+def _enabled():
+    return settings.JWT_USER_CACHE_TIMEOUT > 0
+
+
+def password_digest(user):
+    """What the revoke-token claim is checked against."""
+    # Users rebuilt from the shared cache carry only the digest
+    digest = getattr(user, "_password_digest", None)
+    return digest if digest is not None else get_md5_hash_password(user.password)
+
+
+def _shared_entry(user):
+    return {
+        "fields": {name: getattr(user, name) for name in SHARED_FIELDS},
+        "password_digest": password_digest(user),
+        "expires": time.time() + settings.JWT_USER_CACHE_TIMEOUT,
+    }
+
+
+def _from_shared_entry(user_id, entry):
+    """
+    Rebuild a user from a shared entry and keep it in this process for
+    what is left of the entry's timeout, not a fresh one.
+    """
+    if entry is None:
+        return None
+    remaining = entry["expires"] - time.time()
+    if remaining <= 0:
+        return None
+
+    model = get_user_model()
+    fields = entry["fields"]
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in fields]
+    user = model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+    user._password_digest = entry["password_digest"]
+
+    user_cache.set(str(user_id), user, remaining)
+    return user
+
+
+def get_cached_user(user_id):
+    """A private copy of the cached user, or None on a miss."""
+    if not _enabled():
+        return None
+    user = user_cache.get(str(user_id))
+    if user is None and settings.JWT_USER_CACHE_SHARED:
+        user = _from_shared_entry(
+            user_id, _cache_call("get", USER_KEY.format(pk=user_id))
+        )
+    # Callers may modify request.user; never hand out the cached instance
+    return copy.copy(user) if user is not None else None
+
+
+async def aget_cached_user(user_id):
+    if not _enabled():
+        return None
+    user = user_cache.get(str(user_id))
+    if user is None and settings.JWT_USER_CACHE_SHARED:
+        user = _from_shared_entry(
+            user_id, await _acache_call("get", USER_KEY.format(pk=user_id))
+        )
+    return copy.copy(user) if user is not None else None
+
+
+def remember_user(user_id, user):
+    if not _enabled():
+        return
+    user_cache.set(str(user_id), copy.copy(user))
+    if settings.JWT_USER_CACHE_SHARED:
+        _cache_call(
+            "set", USER_KEY.format(pk=user_id), _shared_entry(user),
+            settings.JWT_USER_CACHE_TIMEOUT,
+        )
+
+
+async def aremember_user(user_id, user):
+    if not _enabled():
+        return
+    user_cache.set(str(user_id), copy.copy(user))
+    if settings.JWT_USER_CACHE_SHARED:
+        await _acache_call(
+            "set", USER_KEY.format(pk=user_id), _shared_entry(user),
+            settings.JWT_USER_CACHE_TIMEOUT,
+        )
+
+
+def forget_user(user_id):
+    user_cache.delete(str(user_id))
+    if settings.JWT_USER_CACHE_SHARED:
+        _cache_call("delete", USER_KEY.format(pk=user_id))
+
+
+# =========================
+# Token Checks
+# =========================
+def token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+def check_user(user, validated_token):
+    """The per-request checks of JWTAuthentication.get_user, cached or not."""
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed("User is inactive")
+
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+        api_settings.REVOKE_TOKEN_CLAIM
+    ) != password_digest(user):
+        raise AuthenticationFailed("The user's password has been changed.")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the user row through the user cache."""
+
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+
+        user = get_cached_user(user_id)
+        if user is not None:
+            check_user(user, validated_token)
+            return user
+
+        # Looks the row up and runs the checks; only valid users get cached
+        user = super().get_user(validated_token)
+        remember_user(user_id, user)
+        return user
+
+
+# =========================
+# Token-claims User
+# =========================
+class TokenClaimsUser:
+    """
+    request.user built from the access token alone. id/pk and is_staff
+    come from claims; reading anything else loads the real user once
+    (through the user cache), so id-only views never touch the database.
+    """
+
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, validated_token):
+        self.token = validated_token
+        # The claim is a string; compare like a real user's integer id
+        self.id = self.pk = get_user_model()._meta.pk.to_python(
+            token_user_id(validated_token)
+        )
+        self._user = None
+
+    @property
+    def is_staff(self):
+        if "is_staff" in self.token:
+            return self.token["is_staff"]
+        return self.user.is_staff
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = CachedJWTAuthentication().get_user(self.token)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined above
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __str__(self):
+        return f"TokenClaimsUser {self.id}"
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class TokenClaimsAuthentication(CachedJWTAuthentication):
+    """
+    For views that only need request.user.id. With JWT_CLAIMS_USER off
+    it behaves exactly like CachedJWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        if not settings.JWT_CLAIMS_USER:
+            return super().get_user(validated_token)
+        return TokenClaimsUser(validated_token)
@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Item Response Cache
+# =========================
+# Every cached entry embeds a version stamp. Writes replace the stamp
+# instead of hunting down keys, so stale entries simply stop matching
+# and age out on their own.
+ITEMS_VERSION_KEY = "items:version"
+ITEM_VERSION_KEY = "items:version:{pk}"
+# Bump when item responses change shape or rows: versions never expire, so
+# entries and ETags from before a deploy would otherwise keep matching
+RESPONSE_FORMAT = 3
+
+
+def _cache_call(method, *args, default=None):
+    """Cache errors (e.g. Redis down) degrade to a miss, never a 500."""
+    try:
+        return getattr(cache, method)(*args)
+    except Exception:
+        logger.warning("Cache %s failed", method, exc_info=True)
+        return default
+
+
+async def _acache_call(method, *args, default=None):
+    """Async twin of _cache_call for consumers."""
+    try:
+        return await getattr(cache, f"a{method}")(*args)
+    except Exception:
+        logger.warning("Cache %s failed", method, exc_info=True)
+        return default
+
+
+def _get_version(key):
+    version = _cache_call("get", key)
+    if version is None:
+        version = time.time_ns()
+        if not _cache_call("add", key, version, None, default=False):
+            version = _cache_call("get", key, default=version)
+    return version
+
+
+def invalidate_items(item_id=None):
+    """Bump the feed version (and one item's version, if given)."""
+    stamp = time.time_ns()
+    keys = {ITEMS_VERSION_KEY: stamp}
+    if item_id is not None:
+        keys[ITEM_VERSION_KEY.format(pk=item_id)] = stamp
+    _cache_call("set_many", keys, None)
+
+
+def cached_item_response(request, render, item_id=None):
+    """
+    Serve a cached GET response for the item feed or one item.
+
+    `render` is only called on a miss. The ETag is derived from the
+    version stamp, so If-None-Match is answered with 304 before any
+    query or serialization runs.
+    """
+    version_key = (
+        ITEMS_VERSION_KEY if item_id is None
+        else ITEM_VERSION_KEY.format(pk=item_id)
+    )
+    version = _get_version(version_key)
+
+    digest = hashlib.md5(
+        f"{RESPONSE_FORMAT}:{version}:{request.build_absolute_uri()}".encode()
+    ).hexdigest()
+    etag = f'"{digest}"'
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response["ETag"] = etag
+        return response
+
+    cache_key = f"items:response:{digest}"
+    data = _cache_call("get", cache_key)
+    if data is not None:
+        response = Response(data)
+    else:
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            _cache_call(
+                "set", cache_key, response.data, settings.ITEM_CACHE_TIMEOUT
+            )
+
+    if response.status_code == status.HTTP_200_OK:
+        response["ETag"] = etag
+    return response
+
+
+# =========================
+# Conditional GET for list views
+# =========================
+class ConditionalListMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on list views with a 304.
+
+    The validator is one aggregate (row count plus the newest timestamps)
+    over the filtered queryset, run before anything is serialized.
+    """
+
+    version_fields = ("created_at",)
+    version_totals = ()
+
+    def get_list_version(self, queryset):
+        # Prefixed aliases so they never collide with queryset annotations
+        version = queryset.order_by().aggregate(
+            version_count=Count("pk"),
+            **{f"max_{field}": Max(field) for field in self.version_fields},
+            **{f"sum_{field}": Sum(field) for field in self.version_totals},
+        )
+        stamps = [
+            version[f"max_{field}"]
+            for field in self.version_fields
+            if version[f"max_{field}"]
+        ]
+
+        token = ":".join(
+            [self.request.get_full_path(), str(self.request.user.pk)]
+            + [str(value) for value in version.values()]
+        )
+        return token, max(stamps) if stamps else None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        token, last_modified = self.get_list_version(queryset)
+
+        etag = f'"{hashlib.md5(token.encode()).hexdigest()}"'
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        # Private to the user, and always revalidated against the validators
+        response["Cache-Control"] = "private, no-cache"
+        return response
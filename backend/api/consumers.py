@@ -1,14 +1,84 @@
 # consumers.py
-import json
+import asyncio
+import time
+from urllib.parse import parse_qs
+from channels.consumer import SyncConsumer
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
 from django.utils import timezone
 
+from . import presence, wire
 from .models import Chat, Message
+from .images import run_image_job
+from .middleware import AUTH_SUBPROTOCOL
+from .ratelimit import rate_limiter
+from .receipts import mark_read, receipt_event
+from .writebehind import message_writer
+
+
+def message_payload(message):
+    return {
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "text": message.text,
+        "sender_id": message.sender_id,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def parse_since(value):
+    """A client's newest message id, or None if absent/invalid."""
+    try:
+        since = int(value)
+    except (TypeError, ValueError):
+        return None
+    return since if since >= 0 else None
+
+
+class ChatSubscription:
+    """Per-chat state for one socket: the authorized chat and its timers."""
+
+    def __init__(self, chat, user_id):
+        self.chat = chat
+        self.group = f"chat_{chat.id}"
+        self.peer_id = (
+            chat.item.owner_id if user_id == chat.buyer_id else chat.buyer_id
+        )
+        self.pending_read = None
+        self.read_flush = None
+        self.peer_online = False
+        self.typing = False            # what the peer was last told
+        self.typing_sent_at = None     # when, for the throttle
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    One socket per user, multiplexing any number of chats.
+
+    The socket joins `user_<id>` for inbox events and `chat_<id>` for
+    each chat it subscribes to. Chat-scoped frames name their chat:
+        {"type": "subscribe", "chat": 7}
+        {"chat": 7, "message": "hi"}
+    On ws/chats/<chat_id>/ that chat is subscribed on connect and is the
+    default for frames without "chat".
+
+    Subscribing with "since" (or ?since= on the single-chat route), the
+    id of the newest message the client has, replays the messages after
+    it before live events resume.
+
+    Frames are JSON text, or MessagePack binary when the client offers
+    the "clixs.msgpack" subprotocol.
+    """
+
+    max_subscriptions = 50
+    default_chat_id = None
+    user_group = None
+    binary = False
+
     async def connect(self):
         user = self.scope.get("user")
 
@@ -16,57 +86,447 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        self.chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
-        self.room_group_name = f"chat_{self.chat_id}"
-
-        # 🔒 Authorization check
-        if not await self.is_user_allowed():
+        # Reconnect loops are refused before they cost a query
+        if not await rate_limiter.aallow(("connect.user", user.id)):
             await self.close()
             return
 
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name,
-        )
-        await self.accept()
+        self.subscriptions = {}
+        self.default_chat_id = self.scope["url_route"]["kwargs"].get("chat_id")
+
+        # 🔒 Authorization check (single-chat route)
+        default_chat = None
+        if self.default_chat_id is not None:
+            default_chat = await self.get_allowed_chat(self.default_chat_id)
+            if default_chat is None or not await rate_limiter.aallow(
+                ("connect.chat", default_chat.id)
+            ):
+                await self.close()
+                return
+
+        # Browsers drop the socket unless one offered subprotocol is echoed
+        subprotocols = self.scope.get("subprotocols", [])
+        self.binary = wire.MSGPACK_SUBPROTOCOL in subprotocols
+        if self.binary:
+            subprotocol = wire.MSGPACK_SUBPROTOCOL
+        elif AUTH_SUBPROTOCOL in subprotocols:
+            subprotocol = AUTH_SUBPROTOCOL
+        else:
+            subprotocol = None
 
+        self.user_group = f"user_{user.id}"
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await self.accept(subprotocol=subprotocol)
+
+        if default_chat is not None:
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            since = parse_since(query.get("since", [None])[0])
+            await self.subscribe(default_chat, since)
+
+    # Queries go through database_sync_to_async rather than the async ORM:
+    # its close_old_connections() is what recycles the shared DB thread's
+    # connection after a database restart or CONN_MAX_AGE.
     @database_sync_to_async
-    def is_user_allowed(self):
-        chat = Chat.objects.get(id=self.chat_id)
-        return self.scope["user"] in [chat.buyer, chat.seller]
+    def get_allowed_chat(self, chat_id):
+        # Kept for the life of the subscription: everything Message.clean
+        # needs, so saving a message doesn't reload the chat
+        chat = (
+            Chat.objects.select_related("item")
+            .only("id", "buyer_id", "item__owner_id", "item__status")
+            .filter(id=chat_id)
+            .first()
+        )
+        if chat is None or not chat.has_participant(self.scope["user"]):
+            return None
+        return chat
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Also reached when the server cancels the consumer at shutdown
+            # (Daphne does, without a disconnect or lifespan events)
+            if settings.CHAT_MESSAGE_DURABILITY != "sync":
+                await message_writer.flush()
+
+    async def disconnect(self, code):
+        for subscription in list(getattr(self, "subscriptions", {}).values()):
+            await self.unsubscribe(subscription)
+
+        if self.user_group:
+            await self.channel_layer.group_discard(
+                self.user_group,
+                self.channel_name,
+            )
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = wire.decode(text_data, bytes_data)
+        if data is None:
+            await self.send_error("Malformed frame")
+            return
+
+        kind = data.get("type")
+
+        if kind == "heartbeat":
+            await self.heartbeat()
+            return
+
+        chat_id = data.get("chat", self.default_chat_id)
+
+        if kind == "subscribe":
+            await self.handle_subscribe(chat_id, parse_since(data.get("since")))
+            return
+
+        subscription = (
+            self.subscriptions.get(chat_id) if type(chat_id) is int else None
+        )
+        if subscription is None:
+            await self.send_error("Not subscribed to this chat", chat_id)
+            return
+
+        if kind == "unsubscribe":
+            await self.unsubscribe(subscription)
+            return
+
+        if kind == "read":
+            await self.queue_read(subscription, data.get("message_id"))
+            return
+
+        if kind == "typing":
+            await self.send_typing(subscription, bool(data.get("is_typing")))
+            return
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
         text = data.get("message")
 
         if not text:
             return
 
+        if not await rate_limiter.aallow(
+            ("message.user", self.scope["user"].id), ("message.chat", chat_id)
+        ):
+            await self.send_error("Slow down: too many messages", chat_id)
+            return
+
         # ✅ SAVE TO DB
-        message = await self.save_message(text)
+        try:
+            message = await self.save_message(subscription.chat, text)
+        except ValidationError as exc:
+            await self.send_error(" ".join(exc.messages), chat_id)
+            return
+        except DatabaseError:
+            await self.send_error("Message could not be saved", chat_id)
+            return
+
+        # The message itself tells the other side typing has stopped
+        subscription.typing = False
+
+        payload = message_payload(message)
 
         await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat.message",
-                "message": {
-                    "id": message.id,
-                    "text": message.text,
-                    "sender_id": self.scope["user"].id,
-                    "created_at": message.created_at.isoformat(),
-                },
-            },
+            subscription.group,
+            wire.group_event("chat.message", payload),
+        )
+
+        # Inbox updates for both sides' other sockets (other tabs, or
+        # sockets that aren't subscribed to this chat)
+        inbox = wire.group_event(
+            "inbox.message",
+            {"type": "inbox", "message": payload},
+            chat_id=message.chat_id,
+        )
+        chat = subscription.chat
+        for user_id in (chat.buyer_id, chat.item.owner_id):
+            await self.channel_layer.group_send(f"user_{user_id}", inbox)
+
+    async def save_message(self, chat, text):
+        durability = settings.CHAT_MESSAGE_DURABILITY
+        if durability == "sync":
+            return await self.create_message(chat, text)
+
+        return await message_writer.submit(
+            chat,
+            self.scope["user"].id,
+            text,
+            wait=durability == "group",
         )
 
     @database_sync_to_async
-    def save_message(self, text):
-        chat = Chat.objects.get(id=self.chat_id)
+    def create_message(self, chat, text):
         return Message.objects.create(
             chat=chat,
-            sender=self.scope["user"],
+            sender_id=self.scope["user"].id,
             text=text,
             created_at=timezone.now(),
         )
 
+    async def send_event(self, payload):
+        await self.send_frame(wire.dump(payload, self.binary))
+
+    async def send_frames(self, frames):
+        """Send the pre-encoded form of a group event."""
+        await self.send_frame(frames["bytes"] if self.binary else frames["text"])
+
+    async def send_frame(self, frame):
+        if self.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def send_error(self, error, chat_id=None):
+        await self.send_event({"type": "error", "chat_id": chat_id, "error": error})
+
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event["message"]))
+        await self.send_frames(event["frames"])
+
+    async def inbox_message(self, event):
+        # A subscribed socket already got the full chat.message
+        if event["chat_id"] in self.subscriptions:
+            return
+        await self.send_frames(event["frames"])
+
+    # =========================
+    # Subscriptions
+    # =========================
+    async def handle_subscribe(self, chat_id, since=None):
+        if type(chat_id) is not int:
+            await self.send_error("Invalid chat", chat_id)
+            return
+
+        # Subscribes count as connects: each one may cost a query
+        if not await rate_limiter.aallow(("connect.user", self.scope["user"].id)):
+            await self.send_error("Slow down: too many subscribes", chat_id)
+            return
+
+        if chat_id in self.subscriptions:
+            await self.send_event({"type": "subscribed", "chat_id": chat_id})
+            if since is not None:
+                await self.replay(self.subscriptions[chat_id], since)
+            return
+
+        if len(self.subscriptions) >= self.max_subscriptions:
+            await self.send_error("Too many open chats", chat_id)
+            return
+
+        chat = await self.get_allowed_chat(chat_id)
+        if chat is None:
+            await self.send_error("Chat not found", chat_id)
+            return
+
+        # Per-chat bucket only after the participant check, so outsiders
+        # can't drain it
+        if not await rate_limiter.aallow(("connect.chat", chat.id)):
+            await self.send_error("Slow down: too many subscribes", chat_id)
+            return
+
+        await self.subscribe(chat, since)
+
+    async def subscribe(self, chat, since=None):
+        subscription = ChatSubscription(chat, self.scope["user"].id)
+        self.subscriptions[chat.id] = subscription
+
+        # Join first: live events queue up behind the replay below, so
+        # nothing falls in the gap (clients drop the odd duplicate by id)
+        await self.channel_layer.group_add(subscription.group, self.channel_name)
+        await self.send_event({"type": "subscribed", "chat_id": chat.id})
+        if since is not None:
+            await self.replay(subscription, since)
+        await self.join_presence(subscription)
+
+    async def replay(self, subscription, since):
+        """
+        Send what the client missed since `since` as one "replay" frame.
+        Past CHAT_REPLAY_LIMIT, has_more tells it to reload over REST.
+        """
+        limit = settings.CHAT_REPLAY_LIMIT
+        missed = await self.load_missed(subscription.chat.id, since, limit + 1)
+
+        await self.send_event(
+            {
+                "type": "replay",
+                "chat_id": subscription.chat.id,
+                "messages": missed[:limit],
+                "has_more": len(missed) > limit,
+            }
+        )
+
+    @database_sync_to_async
+    def load_missed(self, chat_id, since, limit):
+        position = Message.objects.position(chat_id, since)
+        if position is None:
+            # Not written yet (write-behind) or gone: ids are the best guess
+            missed = Message.objects.filter(chat_id=chat_id, id__gt=since)
+        else:
+            missed = Message.objects.after(chat_id, position)
+        return [
+            message_payload(message)
+            for message in missed.only(
+                "id", "chat_id", "sender_id", "text", "created_at"
+            ).order_by("created_at", "id")[:limit]
+        ]
+
+    async def unsubscribe(self, subscription):
+        if self.subscriptions.pop(subscription.chat.id, None) is None:
+            return
+
+        # Don't lose a receipt that is still waiting out its window
+        if subscription.read_flush is not None:
+            subscription.read_flush.cancel()
+            subscription.read_flush = None
+            await self.flush_read(subscription)
+
+        await self.leave_presence(subscription)
+        await self.channel_layer.group_discard(
+            subscription.group,
+            self.channel_name,
+        )
+
+    # =========================
+    # Read Receipts
+    # =========================
+    async def queue_read(self, subscription, message_id):
+        """Hold "read up to" frames for a short window; keep the highest."""
+        if type(message_id) is not int or message_id < 1:
+            return
+
+        subscription.pending_read = max(subscription.pending_read or 0, message_id)
+        if subscription.read_flush is None:
+            subscription.read_flush = asyncio.create_task(
+                self.flush_read_later(subscription)
+            )
+
+    async def flush_read_later(self, subscription):
+        await asyncio.sleep(settings.READ_RECEIPT_WINDOW)
+        subscription.read_flush = None
+        await self.flush_read(subscription)
+
+    async def flush_read(self, subscription):
+        up_to, subscription.pending_read = subscription.pending_read, None
+        if up_to is None:
+            return
+
+        receipt = await database_sync_to_async(mark_read)(
+            subscription.chat.id, self.scope["user"].id, up_to
+        )
+        if receipt is not None:
+            await self.channel_layer.group_send(
+                subscription.group, receipt_event(receipt)
+            )
+
+    async def chat_read(self, event):
+        await self.send_frames(event["frames"])
+
+    # =========================
+    # Presence & Typing
+    # =========================
+    async def join_presence(self, subscription):
+        chat_id = subscription.chat.id
+        user_id = self.scope["user"].id
+        await presence.join(chat_id, user_id)
+
+        await self.channel_layer.group_send(
+            subscription.group, self.presence_event(chat_id, user_id, True)
+        )
+
+        # Tell the newcomer where the other side stands
+        subscription.peer_online = await presence.is_online(
+            chat_id, subscription.peer_id
+        )
+        await self.send_presence(subscription)
+
+    async def leave_presence(self, subscription):
+        chat_id = subscription.chat.id
+        user_id = self.scope["user"].id
+
+        # Another tab may still hold this chat open
+        if not await presence.leave(chat_id, user_id):
+            await self.channel_layer.group_send(
+                subscription.group, self.presence_event(chat_id, user_id, False)
+            )
+
+    @staticmethod
+    def presence_event(chat_id, user_id, online):
+        payload = {
+            "type": "presence",
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "online": online,
+        }
+        return wire.group_event(
+            "chat.presence", payload, chat_id=chat_id, user_id=user_id, online=online
+        )
+
+    async def heartbeat(self):
+        """
+        Keep our presence keys alive, and notice a peer whose key expired
+        without a goodbye (e.g. their worker died). That change is only
+        sent to this socket, so heartbeats never fan out.
+        """
+        user_id = self.scope["user"].id
+        for chat_id, subscription in list(self.subscriptions.items()):
+            await presence.heartbeat(chat_id, user_id)
+
+            online = await presence.is_online(chat_id, subscription.peer_id)
+            if online != subscription.peer_online:
+                subscription.peer_online = online
+                await self.send_presence(subscription)
+
+    async def send_presence(self, subscription):
+        await self.send_event(
+            {
+                "type": "presence",
+                "chat_id": subscription.chat.id,
+                "user_id": subscription.peer_id,
+                "online": subscription.peer_online,
+            }
+        )
+
+    async def chat_presence(self, event):
+        subscription = self.subscriptions.get(event["chat_id"])
+        if subscription is None or event["user_id"] == self.scope["user"].id:
+            return
+        subscription.peer_online = event["online"]
+        await self.send_frames(event["frames"])
+
+    async def send_typing(self, subscription, is_typing):
+        """
+        Throttle typing fan-out: one broadcast, "started" or "stopped", per
+        TYPING_THROTTLE seconds, so alternating frames can't get around it.
+        A dropped "stopped" is harmless: clients hide the indicator when no
+        refresh arrives. "stopped" only goes out after a "started" did.
+        """
+        if not is_typing and not subscription.typing:
+            return
+
+        now = time.monotonic()
+        last = subscription.typing_sent_at
+        if last is not None and now - last < settings.TYPING_THROTTLE:
+            return
+        subscription.typing = is_typing
+        subscription.typing_sent_at = now
+
+        user_id = self.scope["user"].id
+        payload = {
+            "type": "typing",
+            "chat_id": subscription.chat.id,
+            "user_id": user_id,
+            "is_typing": is_typing,
+        }
+        await self.channel_layer.group_send(
+            subscription.group,
+            wire.group_event("chat.typing", payload, user_id=user_id),
+        )
+
+    async def chat_typing(self, event):
+        if event["user_id"] == self.scope["user"].id:
+            return
+        await self.send_frames(event["frames"])
+
+
+class ImageProcessingConsumer(SyncConsumer):
+    """
+    Background worker for ItemImage variants.
+    Run with: python manage.py runworker image-processing
+    """
+
+    def process_image(self, message):
+        run_image_job(message["image_id"])
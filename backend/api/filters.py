@@ -0,0 +1,93 @@
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import SearchQuery
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Item
+
+
+# =========================
+# Item Filters
+# =========================
+class ItemFilterBackend(BaseFilterBackend):
+    """
+    Server-side filtering for the item feed.
+
+    Supported query params:
+        item_type, status, category, owner
+        min_price, max_price          -> sell_price range
+        rent_period, min_rent, max_rent -> rent_<period> column range
+        q                             -> full-text search on title/description
+    """
+
+    exact_params = ("item_type", "status", "category")
+    search_config = "english"
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        for name in self.exact_params:
+            value = params.get(name)
+            if value:
+                queryset = queryset.filter(**{name: value})
+
+        owner = params.get("owner")
+        if owner:
+            queryset = queryset.filter(owner_id=self.parse_int("owner", owner))
+
+        min_price = self.parse_decimal(params, "min_price")
+        max_price = self.parse_decimal(params, "max_price")
+        if min_price is not None:
+            queryset = queryset.filter(sell_price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(sell_price__lte=max_price)
+
+        min_rent = self.parse_decimal(params, "min_rent")
+        max_rent = self.parse_decimal(params, "max_rent")
+        if min_rent is not None or max_rent is not None:
+            rent_field = self.get_rent_field(request)
+            if min_rent is not None:
+                queryset = queryset.filter(**{f"{rent_field}__gte": min_rent})
+            if max_rent is not None:
+                queryset = queryset.filter(**{f"{rent_field}__lte": max_rent})
+
+        text = params.get("q", "").strip()
+        if text:
+            queryset = queryset.filter(
+                search_vector=SearchQuery(
+                    text,
+                    config=self.search_config,
+                    search_type="websearch",
+                )
+            )
+
+        return queryset
+
+    @staticmethod
+    def get_rent_field(request):
+        period = request.query_params.get("rent_period", "daily")
+        if period not in Item.RENT_PERIODS:
+            raise serializers.ValidationError(
+                {"rent_period": f"Must be one of {', '.join(Item.RENT_PERIODS)}."}
+            )
+        return f"rent_{period}"
+
+    def parse_decimal(self, params, name):
+        value = params.get(name)
+        if value in (None, ""):
+            return None
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            number = None
+
+        if number is None or not number.is_finite():
+            raise serializers.ValidationError({name: "A valid number is required."})
+        return number
+
+    def parse_int(self, name, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise serializers.ValidationError({name: "A valid integer is required."})
@@ -0,0 +1,142 @@
+import logging
+from io import BytesIO
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .cache import invalidate_items
+from .models import ItemImage
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Image Variant Pipeline
+# =========================
+THUMBNAIL_SIZE = (480, 330)   # listing cards (cropped to fill)
+MEDIUM_SIZE = (1280, 1280)    # item detail page (fits inside)
+WEBP_QUALITY = 80
+ORIGINAL_QUALITY = 90
+
+
+def _open(field_file):
+    field_file.open("rb")
+    try:
+        img = Image.open(field_file)
+        img.load()
+    finally:
+        field_file.close()
+    return img
+
+
+def _encode(img, fmt, **options):
+    buffer = BytesIO()
+    # No exif= argument, so nothing from the upload is carried over
+    img.save(buffer, format=fmt, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def _rgb(img):
+    if img.mode in ("RGB", "RGBA"):
+        return img
+    return img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+
+def build_variants(img):
+    """Return (thumbnail, medium) WebP files for a decoded image."""
+    img = _rgb(img)
+
+    thumbnail = ImageOps.fit(img, THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+
+    medium = img.copy()
+    medium.thumbnail(MEDIUM_SIZE, Image.Resampling.LANCZOS)
+
+    return (
+        _encode(thumbnail, "WEBP", quality=WEBP_QUALITY),
+        _encode(medium, "WEBP", quality=WEBP_QUALITY),
+    )
+
+
+def _strip_original(field_file, img, fmt):
+    """Rewrite the original upload without its EXIF block."""
+    options = {"quality": ORIGINAL_QUALITY} if fmt in ("JPEG", "WEBP") else {}
+    content = _encode(img, fmt, **options)
+
+    storage, name = field_file.storage, field_file.name
+    storage.delete(name)
+    field_file.name = storage.save(name, content)
+
+
+def process_item_image(item_image):
+    """
+    Generate the WebP variants for an ItemImage and drop EXIF
+    (GPS, camera serials) from the stored original.
+    """
+    original = _open(item_image.image)
+    fmt = original.format
+    has_exif = bool(original.getexif())
+
+    # Bake the EXIF orientation into the pixels before the metadata is dropped
+    img = ImageOps.exif_transpose(original)
+
+    fields = ["thumbnail", "medium", "status"]
+    if has_exif:
+        _strip_original(item_image.image, img, fmt)
+        fields.append("image")
+
+    thumbnail, medium = build_variants(img)
+    stem = Path(item_image.image.name).stem
+
+    item_image.thumbnail.save(f"{stem}_thumb.webp", thumbnail, save=False)
+    item_image.medium.save(f"{stem}_medium.webp", medium, save=False)
+    item_image.status = "READY"
+    item_image.save(update_fields=fields)
+    return item_image
+
+
+# =========================
+# Background Jobs
+# =========================
+PROCESSING_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def run_image_job(image_id):
+    """Worker entry point: process one PENDING image exactly once."""
+    claimed = ItemImage.objects.filter(
+        pk=image_id, status="PENDING"
+    ).update(status="PROCESSING")
+    if not claimed:
+        return
+
+    item_image = ItemImage.objects.filter(pk=image_id).first()
+    if item_image is None:
+        return
+
+    try:
+        process_item_image(item_image)
+    except PROCESSING_ERRORS:
+        logger.exception("Image processing failed for ItemImage %s", image_id)
+        ItemImage.objects.filter(pk=image_id).update(status="FAILED")
+        invalidate_items(item_image.item_id)
+
+
+def schedule_image_jobs(image_ids):
+    """
+    Hand images to the worker on the image-processing channel.
+    Runs inline when IMAGE_PROCESSING_INLINE is set (no worker running).
+    """
+    if settings.IMAGE_PROCESSING_INLINE:
+        for image_id in image_ids:
+            run_image_job(image_id)
+        return
+
+    send = async_to_sync(get_channel_layer().send)
+    for image_id in image_ids:
+        send(
+            settings.IMAGE_PROCESSING_CHANNEL,
+            {"type": "process.image", "image_id": image_id},
+        )
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from asgiref.testing import ApplicationCommunicator
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Chat, CustomUser, Item
+
+BENCH_PREFIX = "bench-"
+
+
+class Communicator(WebsocketCommunicator):
+    # channels' test communicator stubs out close_old_connections; a
+    # benchmark has to pay for it like a real server does
+    send_input = ApplicationCommunicator.send_input
+    receive_output = ApplicationCommunicator.receive_output
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark chat WebSockets in-process: concurrent authenticated "
+        "connects, then messages sent and echoed over each socket. Uses the "
+        "configured database and channel layer; its users are removed after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=200)
+        parser.add_argument("--messages", type=int, default=20,
+                            help="Messages sent per socket.")
+
+    def handle(self, *args, **options):
+        from Clixs.asgi import application
+
+        sockets = self.create_chats(options["sockets"])
+        connections.close_all()
+        try:
+            results = asyncio.run(
+                self.run_sockets(application, sockets, options["messages"])
+            )
+        finally:
+            CustomUser.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            "{sockets} sockets: {connects:.0f} connections/s, "
+            "{messages:.0f} msg/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms".format(**results)
+        ))
+
+    def create_chats(self, count):
+        CustomUser.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+        users = CustomUser.objects.bulk_create(
+            CustomUser(phone_number=f"{BENCH_PREFIX}{i}", first_name="Bench", last_name=str(i))
+            for i in range(count + 1)
+        )
+        seller, buyers = users[0], users[1:]
+        item = Item.objects.create(
+            owner=seller,
+            title="Benchmark",
+            description="Benchmark item",
+            item_type="SELL",
+            sell_price=1,
+        )
+        chats = Chat.objects.bulk_create(
+            Chat(item=item, buyer=buyer, chat_label=f"Benchmark: user_{buyer.id}")
+            for buyer in buyers
+        )
+        return [
+            (chat.id, str(AccessToken.for_user(buyer)))
+            for chat, buyer in zip(chats, buyers)
+        ]
+
+    async def run_sockets(self, application, sockets, messages):
+        latencies = []
+
+        async def connect(chat_id, token):
+            socket = Communicator(application, f"/ws/chats/{chat_id}/?token={token}")
+            connected, _ = await socket.connect(timeout=60)
+            if not connected:
+                raise RuntimeError(f"Chat {chat_id}: handshake refused")
+            return socket
+
+        async def chat(socket):
+            for i in range(messages):
+                sent = time.perf_counter()
+                await socket.send_json_to({"message": f"Message {i}"})
+                # Skip presence and other events until the echo comes back
+                while "text" not in await socket.receive_json_from(timeout=60):
+                    pass
+                latencies.append(time.perf_counter() - sent)
+            await socket.disconnect()
+
+        started = time.perf_counter()
+        opened = await asyncio.gather(*(connect(*socket) for socket in sockets))
+        connected = time.perf_counter()
+        await asyncio.gather(*(chat(socket) for socket in opened))
+        finished = time.perf_counter()
+
+        latencies.sort()
+        return {
+            "sockets": len(sockets),
+            "connects": len(sockets) / (connected - started),
+            "messages": len(latencies) / (finished - connected),
+            "p50": latencies[len(latencies) // 2] * 1000,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        }
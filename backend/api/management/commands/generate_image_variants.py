@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import invalidate_items
+from api.images import PROCESSING_ERRORS, process_item_image
+from api.models import ItemImage
+
+
+class Command(BaseCommand):
+    help = "Generate WebP thumbnail/medium variants for item images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate variants for every image, not only missing ones.",
+        )
+
+    def handle(self, *args, **options):
+        images = ItemImage.objects.all()
+        if not options["all"]:
+            images = images.filter(thumbnail="")
+
+        done = failed = 0
+        for item_image in images.iterator():
+            try:
+                process_item_image(item_image)
+                done += 1
+            except PROCESSING_ERRORS as exc:
+                failed += 1
+                ItemImage.objects.filter(pk=item_image.pk).update(status="FAILED")
+                invalidate_items(item_image.item_id)
+                self.stderr.write(f"ItemImage {item_image.pk}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {done} image(s), {failed} failed."
+        ))
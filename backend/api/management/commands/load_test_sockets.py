@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+
+from channels.testing import HttpCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.management.commands.bench_chat_sockets import Communicator
+from api.models import Chat, CustomUser, Item
+
+LOAD_PREFIX = "load-"
+BATCH = 500
+
+
+class HttpClient(HttpCommunicator):
+    # Like Communicator: without channels' close_old_connections stub
+    send_input = Communicator.send_input
+    receive_output = Communicator.receive_output
+
+
+class ConnectionMonitor(threading.Thread):
+    """Samples how many connections the database has open (peak so far)."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while self.running:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    )
+                    self.peak = max(self.peak, cursor.fetchone()[0])
+                    time.sleep(0.05)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many chat WebSockets open in-process, then fire concurrent "
+        "HTTP requests, and report the peak number of PostgreSQL "
+        "connections. Compare DB_POOL_MODE settings with it. Its users are "
+        "removed after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=5000)
+        parser.add_argument("--requests", type=int, default=300,
+                            help="Concurrent GET /api/v1/chats/ while sockets are open.")
+
+    def handle(self, *args, **options):
+        from Clixs.asgi import application
+
+        users = self.create_chats(max(options["sockets"], options["requests"]))
+        connections.close_all()
+
+        monitor = ConnectionMonitor()
+        monitor.start()
+        try:
+            results = asyncio.run(self.run_load(
+                application, users, options["sockets"], options["requests"], monitor
+            ))
+        finally:
+            monitor.stop()
+            CustomUser.objects.filter(phone_number__startswith=LOAD_PREFIX).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"DB_POOL_MODE={settings.DB_POOL_MODE}: "
+            f"{results['opened']}/{options['sockets']} sockets in {results['socket_time']:.1f}s "
+            f"(peak {results['socket_peak']} connections); "
+            f"{options['requests']} requests in {results['http_time']:.1f}s "
+            f"{dict(results['statuses'])}; peak {monitor.peak} connections"
+        ))
+
+    def create_chats(self, count):
+        """One user and one chat per socket, so presence doesn't fan out."""
+        CustomUser.objects.filter(phone_number__startswith=LOAD_PREFIX).delete()
+        users = CustomUser.objects.bulk_create(
+            CustomUser(phone_number=f"{LOAD_PREFIX}{i}", first_name="Load", last_name=str(i))
+            for i in range(count + 1)
+        )
+        seller, buyers = users[0], users[1:]
+        item = Item.objects.create(
+            owner=seller,
+            title="Load test",
+            description="Load test item",
+            item_type="SELL",
+            sell_price=1,
+        )
+        chats = Chat.objects.bulk_create(
+            Chat(item=item, buyer=buyer, chat_label=f"Load test: user_{buyer.id}")
+            for buyer in buyers
+        )
+        return [
+            (chat.id, str(AccessToken.for_user(buyer)))
+            for chat, buyer in zip(chats, buyers)
+        ]
+
+    async def run_load(self, application, users, sockets, requests, monitor):
+        async def open_socket(chat_id, token):
+            socket = Communicator(application, f"/ws/chats/?token={token}")
+            connected, _ = await socket.connect(timeout=60)
+            if not connected:
+                raise RuntimeError(f"Chat {chat_id}: handshake refused")
+            await socket.send_json_to({"type": "subscribe", "chat": chat_id})
+            await socket.receive_json_from(timeout=60)
+            return socket
+
+        async def request(token):
+            client = HttpClient(
+                application, "GET", "/api/v1/chats/",
+                headers=[(b"authorization", f"Bearer {token}".encode())],
+            )
+            response = await client.get_response(timeout=60)
+            # As a server does once the response is out; Django then
+            # releases the request's connection
+            await client.send_input({"type": "http.disconnect"})
+            await client.wait(timeout=60)
+            return response["status"]
+
+        started = time.perf_counter()
+        opened = []
+        for start in range(0, sockets, BATCH):
+            batch = await asyncio.gather(
+                *(open_socket(*user) for user in users[start:min(sockets, start + BATCH)]),
+                return_exceptions=True,
+            )
+            opened += [socket for socket in batch if not isinstance(socket, BaseException)]
+        socket_time = time.perf_counter() - started
+        socket_peak = monitor.peak
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(
+            *(request(token) for _, token in users[:requests]), return_exceptions=True
+        )
+        http_time = time.perf_counter() - started
+
+        await asyncio.gather(*(socket.disconnect() for socket in opened))
+        return {
+            "opened": len(opened),
+            "socket_time": socket_time,
+            "socket_peak": socket_peak,
+            "http_time": http_time,
+            "statuses": Counter(
+                status if isinstance(status, int) else type(status).__name__
+                for status in statuses
+            ),
+        }
@@ -1,32 +1,90 @@
-from django.contrib.auth.models import AnonymousUser
+from urllib.parse import parse_qs
+
 from channels.db import database_sync_to_async
+from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import aget_cached_user, aremember_user, check_user, token_user_id
+
+# Marker subprotocol; the entry after it carries the access token
+AUTH_SUBPROTOCOL = "clixs.jwt"
 
-@database_sync_to_async
-def get_user_from_token(token):
+
+async def get_user_from_token(token):
+    """
+    Async twin of CachedJWTAuthentication.get_user: the signature check is
+    pure CPU, and the user row comes from the user cache or, on a miss,
+    from database_sync_to_async (which recycles stale connections).
+    """
     jwt_auth = JWTAuthentication()
     validated_token = jwt_auth.get_validated_token(token)
-    return jwt_auth.get_user(validated_token)
+    user_id = token_user_id(validated_token)
+
+    user = await aget_cached_user(user_id)
+    if user is not None:
+        check_user(user, validated_token)
+        return user
+
+    try:
+        user = await database_sync_to_async(jwt_auth.user_model.objects.get)(
+            **{api_settings.USER_ID_FIELD: user_id}
+        )
+    except jwt_auth.user_model.DoesNotExist:
+        raise AuthenticationFailed("User not found")
+
+    check_user(user, validated_token)
+    await aremember_user(user_id, user)
+    return user
+
+
+def get_token(scope):
+    """
+    The JWT from ?token=, or from the subprotocol list as ["clixs.jwt",
+    "<JWT>"] (browsers can't set headers on a WebSocket, and query
+    strings end up in access logs). The token entry is taken out of
+    scope["subprotocols"] so it is never echoed back.
+    """
+    subprotocols = scope.get("subprotocols", [])
+    if AUTH_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(AUTH_SUBPROTOCOL) + 1
+        scope["subprotocols"] = subprotocols[:index] + subprotocols[index + 1:]
+        if index < len(subprotocols):
+            return subprotocols[index]
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return query.get("token", [None])[0]
 
 
 class JwtAuthMiddleware:
     """
     Custom JWT auth middleware for Django Channels.
-    Expects ?token=<JWT> in query string.
+    Takes the token from ?token=<JWT> or the "clixs.jwt" subprotocol, and
+    refuses the handshake outright when it is missing or invalid.
     """
 
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        scope["user"] = AnonymousUser()
+        scope = dict(scope, user=AnonymousUser())
 
-        query_string = scope.get("query_string", b"").decode()
-        if "token=" in query_string:
-            token = query_string.split("token=")[-1]
+        token = get_token(scope)
+        if token:
             try:
                 scope["user"] = await get_user_from_token(token)
-            except Exception:
-                scope["user"] = AnonymousUser()
+            except (InvalidToken, AuthenticationFailed):
+                pass
+
+        if scope["type"] == "websocket" and not scope["user"].is_authenticated:
+            return await self.reject(receive, send)
 
         return await self.inner(scope, receive, send)
+
+    @staticmethod
+    async def reject(receive, send):
+        # Closing before accept makes the server answer the handshake with 403
+        message = await receive()
+        if message["type"] == "websocket.connect":
+            await send({"type": "websocket.close"})
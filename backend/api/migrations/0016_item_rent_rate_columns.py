@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_item_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='rent_daily',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='rent_hourly',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='rent_weekly',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['rent_hourly', 'id'], name='api_item_rent_ho_c6180a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['rent_daily', 'id'], name='api_item_rent_da_2f2d11_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['rent_weekly', 'id'], name='api_item_rent_we_170cd9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'rent_daily', 'id'], name='api_item_categor_ffdbd4_idx'),
+        ),
+    ]
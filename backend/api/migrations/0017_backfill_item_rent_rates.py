@@ -0,0 +1,48 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations
+
+RENT_PERIODS = ("hourly", "daily", "weekly")
+
+
+def parse_rate(value):
+    try:
+        rate = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    if not rate.is_finite() or rate <= 0:
+        return None
+    return rate.quantize(Decimal("0.01"))
+
+
+def backfill_rent_rates(apps, schema_editor):
+    Item = apps.get_model("api", "Item")
+    fields = [f"rent_{period}" for period in RENT_PERIODS]
+
+    batch = []
+    items = Item.objects.filter(rent_prices__isnull=False).only("id", "rent_prices")
+    for item in items.iterator(chunk_size=1000):
+        prices = item.rent_prices if isinstance(item.rent_prices, dict) else {}
+        for period in RENT_PERIODS:
+            value = prices.get(period)
+            rate = parse_rate(value) if value not in (None, "") else None
+            setattr(item, f"rent_{period}", rate)
+        batch.append(item)
+
+        if len(batch) >= 1000:
+            Item.objects.bulk_update(batch, fields)
+            batch = []
+
+    if batch:
+        Item.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_item_rent_rate_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rent_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_backfill_item_rent_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemimage',
+            name='medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='clixs/items/variants/'),
+        ),
+        migrations.AddField(
+            model_name='itemimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='clixs/items/variants/'),
+        ),
+    ]
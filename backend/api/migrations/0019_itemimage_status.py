@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+def mark_processed_images_ready(apps, schema_editor):
+    ItemImage = apps.get_model("api", "ItemImage")
+    ItemImage.objects.exclude(thumbnail="").update(status="READY")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_itemimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemimage',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', editable=False, max_length=10),
+        ),
+        migrations.RunPython(mark_processed_images_ready, migrations.RunPython.noop),
+    ]
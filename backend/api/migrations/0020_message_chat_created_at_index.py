@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_itemimage_status'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='api_message_chat_id_2b3307_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='api_message_created_824429_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at', 'id'], name='api_message_chat_id_023bcc_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_message_chat_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('read_at__isnull', True)), fields=['chat', 'sender'], name='api_message_unread_idx'),
+        ),
+    ]
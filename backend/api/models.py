@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.conf import settings
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -7,6 +11,7 @@ from django.contrib.auth.models import (
     BaseUserManager
 )
 from django.core.exceptions import ValidationError
+from decimal import Decimal, InvalidOperation
 
 
 # =========================
@@ -69,6 +74,8 @@ class Item(models.Model):
         ("RENTED", "Rented"),
     )
 
+    RENT_PERIODS = ("hourly", "daily", "weekly")
+
     title = models.CharField(max_length=100)
     description = models.TextField()
 
@@ -87,6 +94,17 @@ class Item(models.Model):
         help_text="Example: {'daily': 50, 'weekly': 300}"
     )
 
+    # 🔥 Denormalized copies of rent_prices, synced in clean()
+    rent_hourly = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+    rent_daily = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+    rent_weekly = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+
     category = models.CharField(max_length=50, blank=True)
 
     owner = models.ForeignKey(
@@ -103,6 +121,28 @@ class Item(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Maintained by PostgreSQL, never written from Python
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config="english")
+            + SearchVector("description", weight="B", config="english")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on the item feed
+            models.Index(fields=["-created_at", "-id"]),
+            models.Index(fields=["sell_price", "id"]),
+            models.Index(fields=["rent_hourly", "id"]),
+            models.Index(fields=["rent_daily", "id"]),
+            models.Index(fields=["rent_weekly", "id"]),
+            models.Index(fields=["category", "rent_daily", "id"]),
+            GinIndex(fields=["search_vector"]),
+        ]
+
     def clean(self):
         if self.item_type == "SELL":
             if not self.sell_price:
@@ -114,8 +154,38 @@ class Item(models.Model):
             if not isinstance(self.rent_prices, dict):
                 raise ValidationError("Rent prices must be a dictionary.")
 
+        self.sync_rent_rates()
+
+    def sync_rent_rates(self):
+        prices = self.rent_prices if isinstance(self.rent_prices, dict) else {}
+
+        for period in self.RENT_PERIODS:
+            value = prices.get(period)
+            rate = None
+
+            if value not in (None, ""):
+                try:
+                    rate = Decimal(str(value))
+                except InvalidOperation:
+                    rate = None
+                if rate is None or not rate.is_finite() or rate <= 0:
+                    raise ValidationError(
+                        f"Rent price '{period}' must be a positive number."
+                    )
+                rate = rate.quantize(Decimal("0.01"))
+
+            setattr(self, f"rent_{period}", rate)
+
     def save(self, *args, **kwargs):
         self.full_clean()
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "rent_prices" in update_fields:
+            kwargs["update_fields"] = {
+                *update_fields,
+                *(f"rent_{period}" for period in self.RENT_PERIODS),
+            }
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -126,12 +196,40 @@ class Item(models.Model):
 # Item Image
 # =========================
 class ItemImage(models.Model):
+    STATUS_CHOICES = (
+        ("PENDING", "Pending"),
+        ("PROCESSING", "Processing"),
+        ("READY", "Ready"),
+        ("FAILED", "Failed"),
+    )
+
     item = models.ForeignKey(
         Item,
         on_delete=models.CASCADE,
         related_name="images"
     )
     image = models.ImageField(upload_to="clixs/items/")
+
+    # WebP variants generated from image (see api/images.py)
+    thumbnail = models.ImageField(
+        upload_to="clixs/items/variants/",
+        blank=True,
+        editable=False
+    )
+    medium = models.ImageField(
+        upload_to="clixs/items/variants/",
+        blank=True,
+        editable=False
+    )
+
+    # Variants are built by the image worker; READY once they exist
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default="PENDING",
+        editable=False
+    )
+
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
 
@@ -167,6 +265,52 @@ class ContactForm(models.Model):
         ordering = ["-created_at"]
 
 
+# =========================
+# Chat QuerySet
+# =========================
+class ChatQuerySet(models.QuerySet):
+    PREVIEW_LENGTH = 100
+
+    def for_user(self, user):
+        # By id, so token-claims users (no model instance) work too
+        return self.filter(
+            models.Q(buyer_id=user.id) | models.Q(item__owner_id=user.id)
+        )
+
+    def with_preview(self, user):
+        """
+        Annotate last message snippet/sender and the user's unread count.
+        Correlated subqueries keep the whole inbox to one round-trip.
+        """
+        latest = Message.objects.filter(
+            chat=models.OuterRef("pk")
+        ).order_by("-created_at", "-id")
+
+        unread = (
+            Message.objects.filter(
+                chat=models.OuterRef("pk"),
+                read_at__isnull=True,
+            )
+            .exclude(sender_id=user.id)
+            .order_by()
+            .values("chat")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        )
+
+        return self.annotate(
+            last_message_text=models.Subquery(
+                latest.values("text")[:1]
+            ),
+            last_message_sender_id=models.Subquery(
+                latest.values("sender_id")[:1]
+            ),
+            unread_count=Coalesce(
+                models.Subquery(unread, output_field=models.IntegerField()), 0
+            ),
+        )
+
+
 # =========================
 # Chat (Product-based, Anonymous UI)
 # =========================
@@ -193,6 +337,8 @@ class Chat(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_message_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ChatQuerySet.as_manager()
+
     class Meta:
         unique_together = ("item", "buyer")
         ordering = ["-last_message_at"]
@@ -201,8 +347,12 @@ class Chat(models.Model):
     def seller(self):
         return self.item.owner
 
+    def has_participant(self, user):
+        # Compare ids only; select_related("item") makes this query-free
+        return user.id in (self.buyer_id, self.item.owner_id)
+
     def clean(self):
-        if self.buyer == self.item.owner:
+        if self.buyer_id == self.item.owner_id:
             raise ValidationError("Cannot chat with yourself")
         if self.item.status != "ACTIVE":
             raise ValidationError("Chat not allowed on inactive items")
@@ -212,7 +362,7 @@ class Chat(models.Model):
         if not self.chat_label:
             self.chat_label = (
                 f"{self.item.title}: "
-                f"user_{self.buyer.id} - user_{self.item.owner.id}"
+                f"user_{self.buyer_id} - user_{self.item.owner_id}"
             )
 
         self.full_clean()
@@ -221,6 +371,44 @@ class Chat(models.Model):
     def __str__(self):
         return self.chat_label
 
+# =========================
+# Message QuerySet
+# =========================
+class MessageQuerySet(models.QuerySet):
+    # Messages are ordered by (created_at, id), as in the history. Ids
+    # alone don't follow time: write-behind reserves them in blocks.
+    def position(self, chat_id, message_id):
+        """The message's (created_at, id), or None if it isn't stored."""
+        created_at = (
+            self.filter(chat_id=chat_id, id=message_id)
+            .values_list("created_at", flat=True)
+            .first()
+        )
+        return None if created_at is None else (created_at, message_id)
+
+    def after(self, chat_id, position):
+        created_at, message_id = position
+        return self.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id),
+            chat_id=chat_id,
+        )
+
+    def unread_up_to(self, chat_id, reader_id, position):
+        """Unread messages up to `position` that the reader received."""
+        created_at, message_id = position
+        return self.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=message_id),
+            chat_id=chat_id,
+            read_at__isnull=True,
+        ).exclude(sender_id=reader_id)
+
+    def mark_read(self, chat_id, reader_id, position, read_at=None):
+        """Mark them read in a single UPDATE. Returns the row count."""
+        return self.unread_up_to(chat_id, reader_id, position).update(
+            read_at=read_at or timezone.now()
+        )
+
+
 # =========================
 # Message (No Names Exposed)
 # =========================
@@ -228,7 +416,9 @@ class Message(models.Model):
     chat = models.ForeignKey(
         Chat,
         on_delete=models.CASCADE,
-        related_name="messages"
+        related_name="messages",
+        # Covered by the composite indexes below, which lead with chat
+        db_index=False,
     )
 
     sender = models.ForeignKey(
@@ -240,30 +430,44 @@ class Message(models.Model):
     read_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ["created_at"]
         indexes = [
-            models.Index(fields=["chat"]),
-            models.Index(fields=["created_at"]),
+            # History paging: WHERE chat_id = ? ORDER BY created_at, id
+            models.Index(fields=["chat", "created_at", "id"]),
+            # Replay fallback for a since id that isn't stored yet
+            models.Index(fields=["chat", "id"]),
+            # Inbox unread counts only ever look at unread rows
+            models.Index(
+                fields=["chat", "sender"],
+                condition=models.Q(read_at__isnull=True),
+                name="api_message_unread_idx",
+            ),
         ]
 
     def clean(self):
-        if self.sender not in [self.chat.buyer, self.chat.seller]:
+        # Ids only: a chat loaded with select_related("item") costs no queries
+        if self.sender_id not in (self.chat.buyer_id, self.chat.item.owner_id):
             raise ValidationError("Sender not part of this chat")
 
         if self.chat.item.status != "ACTIVE":
             raise ValidationError("Messaging closed for this item")
 
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
-
-        Chat.objects.filter(id=self.chat_id).update(
-            last_message_at=self.created_at
-        )
+        # chat/sender existence is enforced by the FK constraints; skipping
+        # their validation lookups saves two SELECTs per message
+        self.full_clean(exclude=["chat", "sender"])
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Chat.objects.filter(id=self.chat_id).update(
+                last_message_at=self.created_at
+            )
 
     def __str__(self):
-        return f"Message in {self.chat.id}"
+        return f"Message in {self.chat_id}"
 
 
 # =========================
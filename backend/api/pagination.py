@@ -0,0 +1,157 @@
+import base64
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# =========================
+# Keyset (Cursor) Pagination
+# =========================
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination on a (sort key, id) pair.
+
+    The cursor carries the last row's key, so every page is a single
+    index range scan no matter how deep the client has scrolled.
+    Views may override the key with `get_pagination_ordering()`.
+
+    A nullable key is paged in two runs: rows that have it, in key
+    order, then rows without it, newest id first. Each run stays a
+    range scan, and no row drops out of the listing.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        key_field, id_field = self.get_key_fields()
+        nullable = queryset.model._meta.get_field(key_field).null
+        position = self.decode_cursor(request, queryset.model)
+
+        rows = []
+        if position is None or position[0] is not None:
+            keyed = queryset.order_by(*self.ordering)
+            if nullable:
+                keyed = keyed.filter(**{f"{key_field}__isnull": False})
+            if position is not None:
+                keyed = keyed.filter(self.get_seek_filter(*position))
+            rows = list(keyed[: self.page_size + 1])
+
+        if nullable and len(rows) <= self.page_size:
+            unkeyed = queryset.filter(**{f"{key_field}__isnull": True}).order_by(
+                f"-{id_field}"
+            )
+            if position is not None and position[0] is None:
+                unkeyed = unkeyed.filter(**{f"{id_field}__lt": position[1]})
+            rows += unkeyed[: self.page_size + 1 - len(rows)]
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, view):
+        if hasattr(view, "get_pagination_ordering"):
+            return view.get_pagination_ordering()
+        return self.ordering
+
+    def get_key_fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def get_seek_filter(self, value, pk):
+        key_field, id_field = self.get_key_fields()
+        op = "lt" if self.ordering[0].startswith("-") else "gt"
+
+        # Leading range on the first column keeps the composite index usable
+        return Q(**{f"{key_field}__{op}e": value}) & (
+            Q(**{f"{key_field}__{op}": value})
+            | Q(**{f"{id_field}__{op}": pk})
+        )
+
+    def get_position(self, obj):
+        key_field, id_field = self.get_key_fields()
+        return getattr(obj, key_field), getattr(obj, id_field)
+
+    # -------------------------
+    # Cursor encoding
+    # -------------------------
+    def encode_cursor(self, value, pk):
+        if value is None:
+            value = ""
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        raw = f"{value}|{pk}".encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        key_field, _ = self.get_key_fields()
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode()).decode()
+            value, pk = raw.split("|")
+            field = model._meta.get_field(key_field)
+            if value == "" and field.null:
+                return None, int(pk)
+            return field.to_python(value), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(*self.get_position(self.page[-1]))
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ItemCursorPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+
+
+class MessageCursorPagination(KeysetPagination):
+    """Newest messages first; `next` scrolls back through history."""
+
+    page_size = 50
+    max_page_size = 200
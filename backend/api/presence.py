@@ -0,0 +1,45 @@
+from django.conf import settings
+
+from .cache import _acache_call
+
+
+# =========================
+# Chat Presence
+# =========================
+# Lives in the cache (Redis by default), never the database. Each key
+# counts a user's open sockets on one chat and carries a TTL that
+# heartbeats keep pushing back, so a crashed worker's connections
+# simply expire instead of leaving users "online" forever.
+PRESENCE_KEY = "presence:{chat}:{user}"
+
+
+def _key(chat_id, user_id):
+    return PRESENCE_KEY.format(chat=chat_id, user=user_id)
+
+
+async def join(chat_id, user_id):
+    key = _key(chat_id, user_id)
+    await _acache_call("add", key, 0, settings.PRESENCE_TTL)
+    await _acache_call("incr", key)
+    await _acache_call("touch", key, settings.PRESENCE_TTL)
+
+
+async def leave(chat_id, user_id):
+    """Drop one socket; returns True if the user is still online elsewhere."""
+    key = _key(chat_id, user_id)
+    remaining = await _acache_call("decr", key)
+    if remaining is None or remaining <= 0:
+        await _acache_call("delete", key)
+        return False
+    return True
+
+
+async def heartbeat(chat_id, user_id):
+    key = _key(chat_id, user_id)
+    if not await _acache_call("touch", key, settings.PRESENCE_TTL, default=False):
+        # Expired meanwhile (e.g. a long pause): count this socket again
+        await join(chat_id, user_id)
+
+
+async def is_online(chat_id, user_id):
+    return bool(await _acache_call("get", _key(chat_id, user_id)))
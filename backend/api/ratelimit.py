@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Token-bucket Rate Limits
+# =========================
+# CHAT_RATE_LIMITS maps a scope to "<burst>/<period>": up to <burst>
+# actions at once, refilled evenly over the period (s, min, hour, day).
+# Buckets live in Redis (CACHE_REDIS_URL) so all workers share them; if
+# Redis is unset or unreachable, each process keeps its own.
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+BUCKET_KEY = "ratelimit:{scope}:{ident}"
+DENIED_KEY = "ratelimit:denied:{scope}"
+
+REDIS_TIMEOUT = 0.25       # seconds; a slow Redis must not stall sends
+REDIS_RETRY_AFTER = 5      # seconds on local buckets after a Redis error
+LOCAL_BUCKET_LIMIT = 10000
+
+# KEYS: bucket, denied counter (per limit). ARGV: burst, tokens/s (per
+# limit). Takes one token from every bucket, or from none if any is
+# empty, in which case the empty ones' denied counters are bumped.
+TOKEN_BUCKET = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local allowed = true
+
+for i = 1, #KEYS / 2 do
+    local burst = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call("HMGET", KEYS[2 * i - 1], "tokens", "updated")
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    levels[i] = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    if levels[i] < 1 then
+        allowed = false
+        redis.call("INCR", KEYS[2 * i])
+    end
+end
+
+if not allowed then
+    return 0
+end
+
+for i = 1, #KEYS / 2 do
+    local burst = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local tokens = levels[i] - 1
+    redis.call("HSET", KEYS[2 * i - 1], "tokens", tokens, "updated", now)
+    -- Gone once it would have refilled anyway
+    redis.call("EXPIRE", KEYS[2 * i - 1], math.ceil((burst - tokens) / rate) + 1)
+end
+return 1
+"""
+
+
+def parse_rate(rate):
+    """Parse "30/min" into (30, 0.5): burst size and tokens refilled per second."""
+    if not rate:
+        return None
+    count, period = rate.split("/")
+    count = int(count)
+    return count, count / PERIODS[period.strip()[0]]
+
+
+class RateLimiter:
+    """
+    allow() takes one token from each named bucket, all or nothing:
+
+        rate_limiter.allow(("message.user", user_id), ("message.chat", chat_id))
+
+    Scopes missing from CHAT_RATE_LIMITS (or set empty) are unlimited.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}          # key -> (tokens, updated, full_at)
+        self.denied = Counter()    # scope -> denials on local buckets
+        self.fallbacks = 0
+        self.script = None
+        self.redis_down_until = 0
+
+    def _script(self):
+        if not settings.CACHE_REDIS_URL or time.monotonic() < self.redis_down_until:
+            return None
+        if self.script is None:
+            client = redis.Redis.from_url(
+                settings.CACHE_REDIS_URL,
+                socket_timeout=REDIS_TIMEOUT,
+                socket_connect_timeout=REDIS_TIMEOUT,
+            )
+            self.script = client.register_script(TOKEN_BUCKET)
+        return self.script
+
+    def _limits(self, checks):
+        limits = []
+        for scope, ident in checks:
+            rate = parse_rate(settings.CHAT_RATE_LIMITS.get(scope))
+            if rate is not None:
+                limits.append((scope, BUCKET_KEY.format(scope=scope, ident=ident), *rate))
+        return limits
+
+    def allow(self, *checks):
+        limits = self._limits(checks)
+        if not limits:
+            return True
+
+        script = self._script()
+        if script is not None:
+            keys, args = [], []
+            for scope, key, burst, rate in limits:
+                keys += [key, DENIED_KEY.format(scope=scope)]
+                args += [burst, rate]
+            try:
+                return bool(script(keys=keys, args=args))
+            except redis.RedisError:
+                logger.warning("Rate limit store unavailable, using local buckets", exc_info=True)
+                with self.lock:
+                    self.fallbacks += 1
+                    self.redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+        return self._allow_local(limits)
+
+    async def aallow(self, *checks):
+        if self._script() is None:
+            return self._allow_local(self._limits(checks))
+        # Redis is a network round-trip; keep it off the event loop
+        return await sync_to_async(self.allow, thread_sensitive=False)(*checks)
+
+    def _allow_local(self, limits):
+        now = time.monotonic()
+        with self.lock:
+            levels = []
+            for scope, key, burst, rate in limits:
+                tokens, updated, _ = self.buckets.get(key, (burst, now, now))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+
+            empty = [scope for (scope, *_), level in zip(limits, levels) if level < 1]
+            if empty:
+                self.denied.update(empty)
+                return False
+
+            for (scope, key, burst, rate), level in zip(limits, levels):
+                tokens = level - 1
+                self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+
+            if len(self.buckets) > LOCAL_BUCKET_LIMIT:
+                # A full bucket is the same as no bucket
+                self.buckets = {
+                    key: bucket for key, bucket in self.buckets.items()
+                    if bucket[2] > now
+                }
+            return True
+
+    def stats(self):
+        """Denials per scope: shared (Redis) and this process's local buckets."""
+        shared = {}
+        script = self._script()
+        if script is not None:
+            scopes = list(settings.CHAT_RATE_LIMITS)
+            try:
+                counts = script.registered_client.mget(
+                    [DENIED_KEY.format(scope=scope) for scope in scopes]
+                )
+                shared = {scope: int(count or 0) for scope, count in zip(scopes, counts)}
+            except redis.RedisError:
+                logger.warning("Rate limit store unavailable", exc_info=True)
+
+        with self.lock:
+            return {
+                "denied": shared,
+                "denied_local": dict(self.denied),
+                "fallbacks": self.fallbacks,
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,71 @@
+import math
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import _cache_call
+from .models import Message
+from .wire import group_event
+
+
+# =========================
+# Read Receipts
+# =========================
+# "Read up to message X" looks up X's (created_at, id) position, then
+# is one UPDATE over the reader's unread rows up to it. A short-lived
+# watermark per (chat, reader) drops repeats of the same or an older
+# position, so bursts from several tabs or from REST and WebSocket
+# together cost one write and one broadcast.
+READ_WATERMARK_KEY = "chats:read-position:{chat}:{user}"
+
+
+def _watermark_timeout():
+    return max(1, math.ceil(settings.READ_RECEIPT_WINDOW))
+
+
+def mark_read(chat_id, reader_id, up_to_id):
+    """
+    Mark the reader's messages up to `up_to_id` as read.
+    Returns the receipt to broadcast, or None when nothing changed.
+    """
+    position = Message.objects.position(chat_id, up_to_id)
+    if position is None:
+        return None
+
+    key = READ_WATERMARK_KEY.format(chat=chat_id, user=reader_id)
+    watermark = _cache_call("get", key)
+    if watermark is not None and watermark >= position:
+        return None
+
+    read_at = timezone.now()
+    updated = Message.objects.mark_read(chat_id, reader_id, position, read_at)
+    _cache_call("set", key, position, _watermark_timeout())
+
+    return _receipt(chat_id, reader_id, up_to_id, updated, read_at)
+
+
+def _receipt(chat_id, reader_id, up_to_id, updated, read_at):
+    if not updated:
+        return None
+
+    return {
+        "type": "read",
+        "chat_id": chat_id,
+        "reader_id": reader_id,
+        "up_to": up_to_id,
+        "count": updated,
+        "read_at": read_at.isoformat(),
+    }
+
+
+def receipt_event(receipt):
+    return group_event("chat.read", receipt)
+
+
+def broadcast_receipt(receipt):
+    """Send a receipt to the chat group from sync code (REST views)."""
+    async_to_sync(get_channel_layer().group_send)(
+        f"chat_{receipt['chat_id']}", receipt_event(receipt)
+    )
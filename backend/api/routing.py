@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, ImageProcessingConsumer
 
 websocket_urlpatterns = [
+    # One socket per user; chats are subscribed over it
+    path("ws/chats/", ChatConsumer.as_asgi()),
+    # Single-chat form, kept for existing clients
     path("ws/chats/<int:chat_id>/", ChatConsumer.as_asgi()),
 ]
+
+channel_routes = {
+    settings.IMAGE_PROCESSING_CHANNEL: ImageProcessingConsumer.as_asgi(),
+}
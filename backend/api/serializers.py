@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 
@@ -8,6 +9,7 @@ from .models import (
     ContactForm,
     ReportPost,
     Chat,
+    ChatQuerySet,
     Message,
 )
 
@@ -29,6 +31,16 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Login tokens also carry is_staff, read by TokenClaimsUser."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["is_staff"] = user.is_staff
+        return token
+
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
@@ -63,7 +75,7 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 class ItemImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ItemImage
-        fields = ("id", "image", "uploaded_at")
+        fields = ("id", "image", "thumbnail", "medium", "status", "uploaded_at")
 
 
 class ItemSerializer(serializers.ModelSerializer):
@@ -72,9 +84,45 @@ class ItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Item
-        fields = "__all__"
+        exclude = ("search_vector",)
         read_only_fields = ("owner", "created_at")
 
+
+class ItemListSerializer(serializers.ModelSerializer):
+    """Compact card representation used by the item feed."""
+
+    cover_image = serializers.SerializerMethodField()
+    description_preview = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Item
+        fields = (
+            "id",
+            "title",
+            "description_preview",
+            "item_type",
+            "sell_price",
+            "rent_hourly",
+            "rent_daily",
+            "rent_weekly",
+            "status",
+            "category",
+            "cover_image",
+            "created_at",
+        )
+
+    def get_cover_image(self, obj):
+        covers = getattr(obj, "cover_images", None)
+        if covers is None:
+            covers = obj.images.all()[:1]
+        if not covers:
+            return None
+
+        cover = covers[0]
+        url = (cover.thumbnail or cover.image).url
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
 # ======================================================
 # CONTACT / REPORT
 # ======================================================
@@ -106,6 +154,11 @@ class ReportPostSerializer(serializers.ModelSerializer):
 # =========================
 
 class ChatSerializer(serializers.ModelSerializer):
+    # Filled from ChatQuerySet.with_preview() annotations when present
+    last_message = serializers.SerializerMethodField()
+    last_message_is_me = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+
     class Meta:
         model = Chat
         fields = (
@@ -114,8 +167,26 @@ class ChatSerializer(serializers.ModelSerializer):
             "created_at",
             "item",
             "last_message_at",
+            "last_message",
+            "last_message_is_me",
+            "unread_count",
         )
 
+    def get_last_message(self, obj):
+        text = getattr(obj, "last_message_text", None)
+        if text is None:
+            return None
+        limit = ChatQuerySet.PREVIEW_LENGTH
+        return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+    def get_last_message_is_me(self, obj):
+        request = self.context.get("request")
+        sender_id = getattr(obj, "last_message_sender_id", None)
+        return bool(request) and sender_id is not None and sender_id == request.user.id
+
+    def get_unread_count(self, obj):
+        return getattr(obj, "unread_count", 0)
+
 # =========================
 # MESSAGE SERIALIZER (NO NAMES)
 # =========================
@@ -130,15 +201,21 @@ class MessageSerializer(serializers.ModelSerializer):
             "chat",
             "text",
             "is_me",
+            "read_at",
             "created_at",
         )
-        read_only_fields = ("id", "created_at", "is_me")
+        read_only_fields = ("id", "created_at", "is_me", "read_at")
 
     def get_is_me(self, obj):
         request = self.context.get("request")
-        return request and obj.sender == request.user
+        # sender_id avoids loading the sender row for every message
+        return bool(request) and obj.sender_id == request.user.id
 
     def create(self, validated_data):
         request = self.context["request"]
         validated_data["sender"] = request.user
         return super().create(validated_data)
+
+
+class ReadReceiptSerializer(serializers.Serializer):
+    message_id = serializers.IntegerField(min_value=1)
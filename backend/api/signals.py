@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user
+from .cache import invalidate_items
+from .models import CustomUser, Item, ItemImage
+
+
+# =========================
+# Item Cache Invalidation
+# =========================
+# Bumped after commit: a GET in between would otherwise cache the old
+# feed under the new version for ITEM_CACHE_TIMEOUT.
+@receiver([post_save, post_delete], sender=Item)
+def item_changed(sender, instance, **kwargs):
+    item_id = instance.pk
+    transaction.on_commit(lambda: invalidate_items(item_id))
+
+
+@receiver([post_save, post_delete], sender=ItemImage)
+def item_image_changed(sender, instance, **kwargs):
+    item_id = instance.item_id
+    transaction.on_commit(lambda: invalidate_items(item_id))
+
+
+# =========================
+# Auth User Cache Invalidation
+# =========================
+# Deactivation, password changes and deletion all go through here.
+# QuerySet.update() sends no signal; such changes wait out the timeout.
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    # After commit, so a concurrent request can't re-cache the old row.
+    # The pk is read now: deletion clears it before the commit.
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user(user_id))
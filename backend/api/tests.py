@@ -0,0 +1,400 @@
+import asyncio
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import wire
+from .authentication import (
+    USER_KEY,
+    CachedJWTAuthentication,
+    get_cached_user,
+    remember_user,
+    user_cache,
+)
+from .consumers import ChatConsumer, ChatSubscription
+from .models import Chat, CustomUser, Item, Message
+from .receipts import mark_read
+from .writebehind import MessageWriter, message_writer
+
+
+# =========================
+# Query Counts
+# =========================
+# The chat endpoints must cost the same handful of queries however long
+# the history or inbox gets. Redis is swapped for in-process backends so
+# the suite runs without it.
+LOCAL_SERVICES = {
+    "CACHES": {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    },
+    "CHANNEL_LAYERS": {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    },
+}
+
+
+def make_user(phone_number):
+    return CustomUser.objects.create_user(
+        phone_number, "pass1234", first_name="Test", last_name=phone_number
+    )
+
+
+def make_item(owner, title="Bike"):
+    return Item.objects.create(
+        owner=owner,
+        title=title,
+        description="For testing",
+        item_type="SELL",
+        sell_price=100,
+    )
+
+
+@override_settings(**LOCAL_SERVICES)
+class ChatQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user("1000000001")
+        cls.buyer = make_user("1000000002")
+        cls.outsider = make_user("1000000003")
+
+        # A 1,000-message history
+        cls.chat = Chat.objects.create(item=make_item(cls.seller), buyer=cls.buyer)
+        Message.objects.bulk_create(
+            Message(
+                chat=cls.chat,
+                sender=cls.buyer if i % 2 else cls.seller,
+                text=f"Message {i}",
+            )
+            for i in range(1000)
+        )
+
+        # A 200-chat inbox for the buyer, one unread message in each
+        chats = [
+            Chat.objects.create(item=make_item(cls.seller, f"Item {i}"), buyer=cls.buyer)
+            for i in range(199)
+        ]
+        Message.objects.bulk_create(
+            Message(chat=chat, sender=cls.seller, text="Still available?")
+            for chat in chats
+        )
+
+    def setUp(self):
+        cache.clear()
+        user_cache.entries.clear()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.buyer)}"
+        )
+
+    def test_message_history_page(self):
+        url = reverse("chat-messages", args=[self.chat.id])
+
+        # User, chat, ETag aggregate, page
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"page_size": 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 100)
+
+        # The user is cached from here on
+        with self.assertNumQueries(3):
+            response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 100)
+
+    def test_read_receipt_changes_history_etag(self):
+        url = reverse("chat-messages", args=[self.chat.id])
+        etag = self.client.get(url)["ETag"]
+
+        mark_read(self.chat.id, self.buyer.id, self.chat.messages.last().id)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_inbox(self):
+        # User, ETag aggregate, page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("chat-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 200)
+
+    def test_claims_user_skips_the_user_query(self):
+        history = reverse("chat-messages", args=[self.chat.id])
+        inbox = reverse("chat-list")
+
+        for claims_user, user_queries in ((False, 1), (True, 0)):
+            with self.subTest(JWT_CLAIMS_USER=claims_user), \
+                    self.settings(JWT_CLAIMS_USER=claims_user):
+                user_cache.entries.clear()
+                with self.assertNumQueries(3 + user_queries):
+                    self.assertEqual(self.client.get(history).status_code, 200)
+
+                user_cache.entries.clear()
+                with self.assertNumQueries(2 + user_queries):
+                    self.assertEqual(self.client.get(inbox).status_code, 200)
+
+    # close_old_connections would close the test's transaction under it
+    @mock.patch("channels.db.close_old_connections")
+    def test_consumer_participant_check(self, close_old_connections):
+        consumer = ChatConsumer()
+
+        consumer.scope = {"user": self.buyer}
+        with self.assertNumQueries(1):
+            chat = async_to_sync(consumer.get_allowed_chat)(self.chat.id)
+        self.assertEqual(chat, self.chat)
+
+        consumer.scope = {"user": self.outsider}
+        with self.assertNumQueries(1):
+            chat = async_to_sync(consumer.get_allowed_chat)(self.chat.id)
+        self.assertIsNone(chat)
+        self.assertTrue(close_old_connections.called)
+
+
+# =========================
+# Item Feed
+# =========================
+@override_settings(**LOCAL_SERVICES)
+class ItemListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("1000000001")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_carry_a_description_preview(self):
+        Item.objects.filter(pk=make_item(self.owner).pk).update(description="x" * 500)
+
+        response = self.client.get(reverse("item-list"))
+        card = response.data["results"][0]
+        self.assertEqual(card["description_preview"], "x" * 160)
+        self.assertNotIn("description", card)
+
+    def list_ids(self, sort):
+        ids, url = [], reverse("item-list") + f"?sort={sort}&page_size=2"
+        while url:
+            page = self.client.get(url).data
+            ids += [card["id"] for card in page["results"]]
+            url = page["next"]
+        return ids
+
+    def test_price_and_rent_sorts_keep_the_other_listings(self):
+        cheap, dear = make_item(self.owner), make_item(self.owner)
+        Item.objects.filter(pk=dear.pk).update(sell_price=500)
+        rentals = [
+            Item.objects.create(
+                owner=self.owner,
+                title=f"Rental {rate}",
+                description="For testing",
+                item_type="RENT",
+                rent_prices={"daily": rate},
+            )
+            for rate in (30, 10, 20)
+        ]
+        old, mid, new = rentals
+
+        # Listings without the key follow the priced ones, newest first
+        self.assertEqual(
+            self.list_ids("price_low"),
+            [cheap.id, dear.id, new.id, mid.id, old.id],
+        )
+        self.assertEqual(
+            self.list_ids("price_high"),
+            [dear.id, cheap.id, new.id, mid.id, old.id],
+        )
+        self.assertEqual(
+            self.list_ids("rent_low"),
+            [mid.id, new.id, old.id, dear.id, cheap.id],
+        )
+
+
+# =========================
+# Shared User Cache
+# =========================
+@override_settings(JWT_USER_CACHE_SHARED=True, **LOCAL_SERVICES)
+class SharedUserCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("1000000001")
+
+    def setUp(self):
+        cache.clear()
+        user_cache.entries.clear()
+        remember_user(self.user.id, self.user)
+        # As seen from another process
+        user_cache.entries.clear()
+
+    def test_shared_entry_holds_no_password_hash(self):
+        entry = cache.get(USER_KEY.format(pk=self.user.id))
+        self.assertNotIn(self.user.password, str(entry))
+        self.assertNotIn(self.user.phone_number, str(entry))
+
+    def test_shared_hit_keeps_the_remaining_timeout(self):
+        key = USER_KEY.format(pk=self.user.id)
+        cache.set(key, dict(cache.get(key), expires=time.time() + 5))
+
+        self.assertEqual(get_cached_user(self.user.id), self.user)
+        _, expires = user_cache.entries[str(self.user.id)]
+        self.assertLessEqual(expires - time.monotonic(), 5)
+
+    def test_expired_shared_entry_is_a_miss(self):
+        key = USER_KEY.format(pk=self.user.id)
+        cache.set(key, dict(cache.get(key), expires=time.time() - 1))
+        self.assertIsNone(get_cached_user(self.user.id))
+
+    def test_shared_hit_authenticates_and_loads_the_profile(self):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+        # No user lookup; the profile fields come in one query
+        with self.assertNumQueries(1):
+            response = client.get(reverse("user-profile"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["phone_number"], self.user.phone_number)
+
+    def test_revoke_check_uses_the_shared_digest(self):
+        with mock.patch.object(api_settings, "CHECK_REVOKE_TOKEN", True):
+            with self.assertNumQueries(0):
+                user = CachedJWTAuthentication().get_user(AccessToken.for_user(self.user))
+            self.assertEqual(user, self.user)
+
+            # A token issued under another password
+            user_cache.entries.clear()
+            self.user.set_password("changed")
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().get_user(AccessToken.for_user(self.user))
+
+    def test_delete_forgets_the_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.get(pk=self.user.pk).delete()
+        self.assertIsNone(cache.get(USER_KEY.format(pk=self.user.id)))
+
+
+# =========================
+# Message Order
+# =========================
+@override_settings(**LOCAL_SERVICES)
+@mock.patch("channels.db.close_old_connections")
+class MessageOrderTests(TestCase):
+    """Replay and receipts follow (created_at, id), not the bare id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user("1000000001")
+        cls.buyer = make_user("1000000002")
+        cls.chat = Chat.objects.create(item=make_item(cls.seller), buyer=cls.buyer)
+
+        # Two write-behind processes: the later message got the lower id
+        now = timezone.now()
+        cls.first, cls.second = Message.objects.bulk_create([
+            Message(id=10**9 + 100, chat=cls.chat, sender=cls.seller,
+                    text="first", created_at=now),
+            Message(id=10**9, chat=cls.chat, sender=cls.seller,
+                    text="second", created_at=now + timedelta(seconds=1)),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def load_missed(self, since):
+        consumer = ChatConsumer()
+        missed = async_to_sync(consumer.load_missed)(self.chat.id, since, 10)
+        return [message["text"] for message in missed]
+
+    def test_replay_after_a_higher_id(self, close_old_connections):
+        self.assertEqual(self.load_missed(self.first.id), ["second"])
+        self.assertEqual(self.load_missed(self.second.id), [])
+
+    def test_replay_after_an_unknown_id(self, close_old_connections):
+        self.assertEqual(self.load_missed(0), ["first", "second"])
+
+    def test_read_up_to_a_lower_id(self, close_old_connections):
+        receipt = mark_read(self.chat.id, self.buyer.id, self.second.id)
+        self.assertEqual(receipt["count"], 2)
+
+        # An older position than the watermark is a no-op
+        self.assertIsNone(mark_read(self.chat.id, self.buyer.id, self.first.id))
+
+    def test_read_up_to_stops_at_the_position(self, close_old_connections):
+        mark_read(self.chat.id, self.buyer.id, self.first.id)
+        self.assertQuerySetEqual(
+            Message.objects.filter(read_at__isnull=True), [self.second]
+        )
+
+
+# =========================
+# Write-behind
+# =========================
+@override_settings(CHAT_MESSAGE_DURABILITY="async", **LOCAL_SERVICES)
+class WriteBehindTests(SimpleTestCase):
+    def test_cancelled_consumer_flushes_the_queue(self):
+        # Daphne's shutdown: the consumer is cancelled, no disconnect
+        async def run():
+            app = ChatConsumer.as_asgi()
+            task = asyncio.create_task(
+                app({"type": "websocket"}, asyncio.Queue().get, mock.AsyncMock())
+            )
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(message_writer, "flush") as flush:
+            async_to_sync(run)()
+        flush.assert_awaited_once()
+
+    @mock.patch("api.writebehind.write_messages", side_effect=TypeError)
+    def test_unexpected_write_error_is_dropped_as_a_database_error(self, write):
+        async def run():
+            writer = MessageWriter()
+            writer._bind()
+            done = writer.loop.create_future()
+            await writer._write([(Message(id=1, text="hi"), done)])
+            return done.exception()
+
+        with self.assertLogs("api.writebehind", "ERROR"):
+            error = async_to_sync(run)()
+        self.assertIsInstance(error, DatabaseError)
+
+
+# =========================
+# Typing
+# =========================
+@override_settings(TYPING_THROTTLE=60)
+class TypingThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.scope = {"user": CustomUser(id=2)}
+        self.consumer.channel_layer = mock.AsyncMock()
+        chat = Chat(id=1, buyer_id=2, item=Item(owner_id=1))
+        self.subscription = ChatSubscription(chat, 2)
+
+    def send(self, *frames):
+        for is_typing in frames:
+            async_to_sync(self.consumer.send_typing)(self.subscription, is_typing)
+        return [
+            wire.decode(call.args[1]["frames"]["text"])["is_typing"]
+            for call in self.consumer.channel_layer.group_send.call_args_list
+        ]
+
+    def test_alternating_frames_are_throttled(self):
+        self.assertEqual(self.send(True, False, True, False, True), [True])
+
+    def test_stopped_needs_a_started(self):
+        self.assertEqual(self.send(False, False), [])
+
+    @override_settings(TYPING_THROTTLE=0)
+    def test_started_then_stopped(self):
+        self.assertEqual(self.send(True, True, False, False), [True, True, False])
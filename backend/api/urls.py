@@ -25,7 +25,9 @@ from .views import (
     ChatCreateView,
     ChatListView,
     ChatMessagesView,
+    ChatReadView,
     SendMessageView,
+    RateLimitStatsView,
 )
 
 # =========================
@@ -76,9 +78,19 @@ urlpatterns = [
         ChatMessagesView.as_view(),
         name="chat-messages",
     ),
+    path(
+        "chats/<int:chat_id>/read/",
+        ChatReadView.as_view(),
+        name="chat-read",
+    ),
     path(
         "messages/send/",
         SendMessageView.as_view(),
         name="send-message",
     ),
+    path(
+        "chats/rate-limits/",
+        RateLimitStatsView.as_view(),
+        name="chat-rate-limits",
+    ),
 ]
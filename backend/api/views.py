@@ -1,11 +1,15 @@
-from rest_framework import viewsets, generics, permissions, status
+from rest_framework import (
+    viewsets, generics, permissions, status, serializers, exceptions
+)
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.functions import Left
 
 from .models import (
     Item, ItemImage, ContactForm, ReportPost,
@@ -13,10 +17,17 @@ from .models import (
 )
 from .serializers import (
     UserSerializer, UserRegisterSerializer,
-    ItemSerializer, ItemImageSerializer,
+    ItemSerializer, ItemListSerializer, ItemImageSerializer,
     ContactFormSerializer, ReportPostSerializer,
-     ChatSerializer, MessageSerializer
+     ChatSerializer, MessageSerializer, ReadReceiptSerializer
 )
+from .pagination import ItemCursorPagination, MessageCursorPagination
+from .filters import ItemFilterBackend
+from .images import schedule_image_jobs
+from .cache import ConditionalListMixin, cached_item_response
+from .receipts import mark_read, broadcast_receipt
+from .authentication import TokenClaimsAuthentication
+from .ratelimit import rate_limiter
 
 User = get_user_model()
 
@@ -45,7 +56,13 @@ class UserProfileView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        # Users from the shared auth cache hold only the auth fields; load
+        # the rest in one query rather than one per field
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
 
 
 class DeleteAccountView(generics.DestroyAPIView):
@@ -62,14 +79,90 @@ class DeleteAccountView(generics.DestroyAPIView):
 # =========================
 # Item Views
 # =========================
+# Cards clamp the description to two lines; this is more than enough
+DESCRIPTION_PREVIEW_LENGTH = 160
+
+
 class ItemViewSet(viewsets.ModelViewSet):
-    queryset = Item.objects.select_related("owner").prefetch_related("images")
+    queryset = (
+        Item.objects.defer("search_vector")
+        .select_related("owner")
+        .prefetch_related("images")
+    )
     serializer_class = ItemSerializer
     permission_classes = [
         permissions.IsAuthenticatedOrReadOnly,
         IsOwnerOrReadOnly
     ]
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = ItemCursorPagination
+    filter_backends = [ItemFilterBackend]
+
+    sort_orderings = {
+        "newest": ("-created_at", "-id"),
+        "oldest": ("created_at", "id"),
+        "price_low": ("sell_price", "id"),
+        "price_high": ("-sell_price", "-id"),
+        "rent_low": ("{rent}", "id"),
+        "rent_high": ("-{rent}", "-id"),
+    }
+
+    def get_queryset(self):
+        if self.action != "list":
+            return super().get_queryset()
+
+        # Cards need one cover image, not the owner or the whole gallery,
+        # and the start of the description, cut in the database
+        return Item.objects.only(
+            "id", "title", "item_type", "status", "category", "created_at",
+            "sell_price", "rent_hourly", "rent_daily", "rent_weekly",
+        ).annotate(
+            description_preview=Left("description", DESCRIPTION_PREVIEW_LENGTH)
+        ).prefetch_related(
+            Prefetch(
+                "images",
+                queryset=ItemImage.objects.order_by("id")[:1],
+                to_attr="cover_images",
+            )
+        )
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return ItemListSerializer
+        return super().get_serializer_class()
+
+    # Item payloads do not depend on the caller, so reads share one cache
+    def list(self, request, *args, **kwargs):
+        return cached_item_response(
+            request, lambda: super(ItemViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            item_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        return cached_item_response(
+            request,
+            lambda: super(ItemViewSet, self).retrieve(request, *args, **kwargs),
+            item_id=item_id,
+        )
+
+    def get_sort(self):
+        sort = self.request.query_params.get("sort", "newest")
+        if sort not in self.sort_orderings:
+            raise serializers.ValidationError(
+                {"sort": f"Must be one of {', '.join(self.sort_orderings)}."}
+            )
+        return sort
+
+    def get_pagination_ordering(self):
+        ordering = self.sort_orderings[self.get_sort()]
+        if "{rent}" in ordering[0]:
+            rent_field = ItemFilterBackend.get_rent_field(self.request)
+            ordering = tuple(field.format(rent=rent_field) for field in ordering)
+        return ordering
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -77,13 +170,28 @@ class ItemViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        item = serializer.save(owner=request.user)
 
         images = request.FILES.getlist("images")
-        for image in images:
-            ItemImage.objects.create(item=item, image=image)
+        if images:
+            try:
+                serializers.ListField(child=serializers.ImageField()).run_validation(images)
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({"images": exc.detail})
+
+        with transaction.atomic():
+            item = serializer.save(owner=request.user)
+            item_images = ItemImage.objects.bulk_create(
+                [ItemImage(item=item, image=image) for image in images]
+            )
+
+            if item_images:
+                image_ids = [item_image.id for item_image in item_images]
+                transaction.on_commit(
+                    lambda: schedule_image_jobs(image_ids), robust=True
+                )
 
-        item.refresh_from_db()
+        # Serve the response from memory; no re-fetch of item or images
+        item._prefetched_objects_cache = {"images": item_images}
         return Response(
             self.get_serializer(item).data,
             status=status.HTTP_201_CREATED
@@ -102,7 +210,10 @@ class ItemImageViewSet(viewsets.ModelViewSet):
         return ItemImage.objects.filter(item__owner=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(item_id=self.request.data.get("item"))
+        item_image = serializer.save(item_id=self.request.data.get("item"))
+        transaction.on_commit(
+            lambda: schedule_image_jobs([item_image.id]), robust=True
+        )
 
 
 # =========================
@@ -160,28 +271,71 @@ class ChatCreateView(APIView):
         )
 
 
-class ChatListView(generics.ListAPIView):
+class ChatListView(ConditionalListMixin, generics.ListAPIView):
     serializer_class = ChatSerializer
+    authentication_classes = [TokenClaimsAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    version_fields = ("created_at", "last_message_at")
+    version_totals = ("unread_count",)
 
     def get_queryset(self):
         user = self.request.user
-        return Chat.objects.filter(
-            Q(buyer=user) | Q(item__owner=user)
-        ).select_related("item")
+        return Chat.objects.for_user(user).with_preview(user)
 
 
-class ChatMessagesView(generics.ListAPIView):
+class ChatMessagesView(ConditionalListMixin, generics.ListAPIView):
     serializer_class = MessageSerializer
+    authentication_classes = [TokenClaimsAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
+    # read_at: a read receipt changes the page without adding a message
+    version_fields = ("created_at", "read_at")
+
+    def get_chat(self):
+        if not hasattr(self, "_chat"):
+            self._chat = get_object_or_404(
+                Chat.objects.select_related("item").only(
+                    "id", "buyer_id", "item__owner_id"
+                ),
+                id=self.kwargs["chat_id"],
+            )
+        return self._chat
 
     def get_queryset(self):
-        chat = get_object_or_404(Chat, id=self.kwargs["chat_id"])
+        chat = self.get_chat()
 
-        if self.request.user not in [chat.buyer, chat.seller]:
+        if not chat.has_participant(self.request.user):
             return Message.objects.none()
 
-        return chat.messages.all()
+        return Message.objects.filter(chat_id=chat.id)
+
+
+class ChatReadView(APIView):
+    """Mark the chat read up to `message_id` and notify the other side."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, chat_id):
+        chat = get_object_or_404(
+            Chat.objects.select_related("item").only(
+                "id", "buyer_id", "item__owner_id"
+            ),
+            id=chat_id,
+        )
+
+        if not chat.has_participant(request.user):
+            raise exceptions.PermissionDenied()
+
+        serializer = ReadReceiptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        receipt = mark_read(
+            chat.id, request.user.id, serializer.validated_data["message_id"]
+        )
+        if receipt is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        broadcast_receipt(receipt)
+        return Response(receipt)
 
 
 class SendMessageView(generics.CreateAPIView):
@@ -189,9 +343,26 @@ class SendMessageView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        chat = get_object_or_404(Chat, id=self.request.data.get("chat"))
+        chat = get_object_or_404(
+            Chat.objects.select_related("item"),
+            id=self.request.data.get("chat"),
+        )
+
+        if not chat.has_participant(self.request.user):
+            raise exceptions.PermissionDenied()
 
-        if self.request.user not in [chat.buyer, chat.seller]:
-            raise permissions.PermissionDenied()
+        # Same buckets as WebSocket sends
+        if not rate_limiter.allow(
+            ("message.user", self.request.user.id), ("message.chat", chat.id)
+        ):
+            raise exceptions.Throttled()
 
         serializer.save(chat=chat)
+
+
+class RateLimitStatsView(APIView):
+    """How often each chat rate limit has refused a connect or message."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(rate_limiter.stats())
@@ -0,0 +1,40 @@
+import msgpack
+import ujson
+
+
+# =========================
+# WebSocket Wire Format
+# =========================
+# JSON text frames by default. A client that offers the "clixs.msgpack"
+# subprotocol gets the same payloads as binary MessagePack frames.
+MSGPACK_SUBPROTOCOL = "clixs.msgpack"
+
+
+def encode(payload):
+    """
+    Both encodings of one payload. Group events carry these, so a
+    fan-out is serialized once by the sender, not once per recipient.
+    """
+    return {"text": ujson.dumps(payload), "bytes": msgpack.packb(payload)}
+
+
+def dump(payload, binary):
+    """Encode a payload for a single socket."""
+    return msgpack.packb(payload) if binary else ujson.dumps(payload)
+
+
+def group_event(event_type, payload, **fields):
+    """A channel-layer event whose client frame is already encoded."""
+    return {"type": event_type, "frames": encode(payload), **fields}
+
+
+def decode(text_data=None, bytes_data=None):
+    """Parse an inbound frame; None if it isn't a JSON/msgpack object."""
+    try:
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data)
+        else:
+            data = ujson.loads(text_data)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return None
+    return data if isinstance(data, dict) else None
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Chat, Message
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Write-behind Message Persistence
+# =========================
+# CHAT_MESSAGE_DURABILITY picks the trade-off:
+#   "sync"  - one transaction per message, broadcast after it commits
+#   "group" - batched INSERTs, broadcast after the message's batch commits
+#   "async" - broadcast at once, batch is written shortly after; messages
+#             still queued are lost if the process dies
+#
+# On a clean shutdown the queue is drained twice over: by the lifespan
+# handler below (uvicorn and other lifespan servers), and by each
+# ChatConsumer as it is cancelled (Daphne, which sends no lifespan
+# events and never calls disconnect() on shutdown).
+
+
+def _reserve_ids(count):
+    """Take `count` ids from the Message id sequence in one round-trip."""
+    table = Message._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _write_batch(messages):
+    """INSERT a batch and bump each chat's last_message_at in one transaction."""
+    latest = {}
+    for message in messages:
+        latest[message.chat_id] = max(
+            latest.get(message.chat_id, message.created_at), message.created_at
+        )
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        # GREATEST skips NULLs and never moves a newer timestamp backwards
+        Chat.objects.filter(id__in=latest).update(
+            last_message_at=Greatest(
+                F("last_message_at"),
+                Case(*[
+                    When(id=chat_id, then=Value(created_at))
+                    for chat_id, created_at in latest.items()
+                ]),
+            )
+        )
+
+
+def write_messages(messages):
+    """
+    Persist a batch; if it is rejected (e.g. a chat was deleted
+    meanwhile), fall back to one row at a time so only the bad ones drop.
+    Returns the messages that could not be saved.
+    """
+    try:
+        _write_batch(messages)
+        return []
+    except DatabaseError:
+        logger.warning("Message batch failed, retrying one by one", exc_info=True)
+
+    failed = []
+    for message in messages:
+        try:
+            _write_batch([message])
+        except DatabaseError:
+            logger.exception("Dropped chat message %s", message.id)
+            failed.append(message)
+    return failed
+
+
+class MessageWriter:
+    """
+    Per-process buffer between ChatConsumer and the database.
+
+    Messages get their id and timestamp up front, so they can be
+    broadcast before the INSERT. One background task drains the queue in
+    bulk_create batches. The queue is bounded: when the database falls
+    behind, submit() waits instead of letting memory grow.
+    """
+
+    def __init__(self):
+        self.loop = None
+
+    def _bind(self):
+        # Queues and locks belong to one event loop; rebuild on a new one
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.queue = asyncio.Queue(maxsize=settings.CHAT_WRITE_QUEUE_SIZE)
+            self.id_lock = asyncio.Lock()
+            self.write_lock = asyncio.Lock()
+            self.ids = []
+            self.task = None
+
+    async def next_id(self):
+        async with self.id_lock:
+            if not self.ids:
+                self.ids = await database_sync_to_async(_reserve_ids)(
+                    settings.CHAT_WRITE_BATCH_SIZE
+                )
+            return self.ids.pop(0)
+
+    async def submit(self, chat, sender_id, text, wait=False):
+        """
+        Validate and queue a message, returning it with id/created_at set.
+        With wait=True, return only once its batch has committed.
+        """
+        self._bind()
+
+        message = Message(
+            chat=chat,
+            sender_id=sender_id,
+            text=text,
+            created_at=timezone.now(),
+        )
+        # Pure Python checks only: the FKs are enforced by the database
+        # and the pre-assigned id is unique by construction
+        message.full_clean(exclude=["chat", "sender"], validate_unique=False)
+        message.id = await self.next_id()
+
+        done = self.loop.create_future() if wait else None
+        await self.queue.put((message, done))
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+        if done is not None:
+            await done
+        return message
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            async with self.write_lock:
+                # Nobody is waiting on a fire-and-forget message, so give
+                # a burst a moment to pile up into one INSERT. Waiters are
+                # written at once; what arrives meanwhile forms the next batch.
+                if batch[0][1] is None:
+                    await asyncio.sleep(settings.CHAT_WRITE_FLUSH_INTERVAL)
+                await self._write(batch)
+
+    async def flush(self):
+        """Write everything queued right now (disconnect / shutdown)."""
+        if self.loop is not asyncio.get_running_loop():
+            return
+        await self._write([])
+        # ...and wait out a batch the background task is still holding
+        async with self.write_lock:
+            pass
+
+    async def _write(self, batch):
+        while len(batch) < settings.CHAT_WRITE_BATCH_SIZE and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if not batch:
+            return
+
+        messages = [message for message, _ in batch]
+        try:
+            failed = await database_sync_to_async(write_messages)(messages)
+        except Exception:
+            # Not something the one-by-one retry can sort out: drop the
+            # batch rather than raise into the senders' sockets
+            logger.exception("Dropped chat message batch of %d", len(messages))
+            failed = messages
+        error = DatabaseError("Message could not be saved")
+
+        for message, done in batch:
+            if done is None or done.done():
+                continue
+            if message in failed:
+                done.set_exception(error)
+            else:
+                done.set_result(message)
+
+        if not self.queue.empty():
+            await self._write([])
+
+
+message_writer = MessageWriter()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan handler: flush queued messages before the server exits."""
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            await message_writer.flush()
+            await send({"type": "lifespan.shutdown.complete"})
+            return